@@ -1,10 +1,15 @@
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 from flask_migrate import Migrate
+import orjson
 import pygame
+import sqlite3
 import threading
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from app.models import db, Device, PatchedDevice, Sequence, Playlist
 from app.hardware import DMXController, AudioPlayer, setup_gpio, cleanup_gpio, RPI_AVAILABLE
-from app.services import playback, process_audio_upload, serve_audio_preview
+from app.services import playback, process_audio_upload, serve_audio_preview, serve_waveform_binary
 from app.api import device_api, sequence_api, playback_api, network_api, system_api
 
 # Fix for scipy compatibility
@@ -15,11 +20,37 @@ try:
 except ImportError:
     pass
 
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson.
+
+    Every jsonify() call in the blueprints serializes through here, so big
+    responses (sequence events, dmx-status polls) are encoded in native code
+    instead of stdlib json. Unsupported types still go through the default
+    hook for the stock behavior.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Create Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = 'dmx-lighting-control-secret-key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///dmx_control.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Explicit connection pool: reuse warm SQLite connections across requests
+# instead of reopening the database file, and pre-ping so a connection
+# broken by a restart or file swap is replaced instead of erroring
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'pool_pre_ping': True,
+    'pool_recycle': 1800,
+}
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 150 * 1024 * 1024  # 150MB max file size
 
@@ -27,8 +58,29 @@ app.config['MAX_CONTENT_LENGTH'] = 150 * 1024 * 1024  # 150MB max file size
 db.init_app(app)
 migrate = Migrate(app, db)
 
-# Initialize pygame mixer for audio
-pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_conn, connection_record):
+    """Tune each SQLite connection as it is opened.
+
+    WAL turns every commit into a log append instead of a journal rewrite
+    plus fsync pair and stops writers from blocking readers; the rest trades
+    a little RAM for fewer disk touches on the Pi's SD card.
+    """
+    if isinstance(dbapi_conn, sqlite3.Connection):
+        cursor = dbapi_conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA mmap_size=268435456')  # 256MB mmap window
+        cursor.execute('PRAGMA cache_size=-32000')  # 32MB page cache
+        cursor.close()
+
+# Initialize pygame mixer for audio. Smaller buffers cut trigger-to-sound
+# latency proportionally (256 samples ~= 5.8ms at 44.1kHz) but underrun
+# easily on the Pi's audio stack, so the Pi keeps the proven 512 baseline.
+pygame.mixer.pre_init(frequency=44100, size=-16, channels=2,
+                      buffer=512 if RPI_AVAILABLE else 256)
+pygame.mixer.init()
 
 # Setup GPIO pins
 setup_gpio()
@@ -56,6 +108,10 @@ def upload_song():
 def audio_preview(song_id):
     return serve_audio_preview(app, song_id)
 
+@app.route('/api/waveform/<int:song_id>')
+def waveform_binary(song_id):
+    return serve_waveform_binary(song_id)
+
 # Basic page routes
 @app.route('/')
 def index():
@@ -163,7 +219,19 @@ if __name__ == '__main__':
         button_thread.start()
 
     try:
-        app.run(host='0.0.0.0', port=5000, debug=False)
+        # Production WSGI server: the Werkzeug dev server handles one request
+        # at a time and its reloader stats the whole source tree, which is
+        # enough to throttle the status polls on a Pi. waitress serves from
+        # a small thread pool with no debugger and no reloader.
+        try:
+            from waitress import serve
+        except ImportError:
+            serve = None
+
+        if serve is not None:
+            serve(app, host='0.0.0.0', port=5000, threads=8, connection_limit=200)
+        else:
+            app.run(host='0.0.0.0', port=5000, debug=False)
     finally:
         dmx_controller.stop()
         cleanup_gpio()
\ No newline at end of file
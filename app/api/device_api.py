@@ -1,4 +1,6 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import delete
+from sqlalchemy.orm import joinedload
 from app.models.models import Device, PatchedDevice, db
 
 device_api = Blueprint('device_api', __name__)
@@ -112,8 +114,10 @@ def patch_device():
         if existing_patch_same_device:
             return jsonify({'error': f'Device "{device.name}" is already patched at address {start_address}'}), 400
         
-        # Check for overlapping addresses with existing patches
-        existing_patches = PatchedDevice.query.all()
+        # Check for overlapping addresses with existing patches. Join the
+        # devices in up front - touching existing.device lazily would issue
+        # one extra SELECT per patched device
+        existing_patches = PatchedDevice.query.options(joinedload(PatchedDevice.device)).all()
         for existing in existing_patches:
             existing_channels = existing.device.get_channels()
             existing_channel_count = len(existing_channels) if existing_channels else 1
@@ -265,7 +269,8 @@ def get_patched_devices():
 @device_api.route('/api/clear-all-patch', methods=['POST'])
 def clear_all_patch():
     try:
-        PatchedDevice.query.delete()
+        # Core DELETE: one statement, no per-row ORM session synchronization
+        db.session.execute(delete(PatchedDevice).execution_options(synchronize_session=False))
         db.session.commit()
         return jsonify({'success': True})
     
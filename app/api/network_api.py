@@ -1,42 +1,235 @@
+import hashlib
 import os
+import shlex
 import subprocess
+import threading
+import time
 from flask import Blueprint, request, jsonify
 
 network_api = Blueprint('network_api', __name__)
 
+# NetworkManager D-Bus binding (libnm via python-gi). Talking to NM directly
+# returns typed data and skips the fork/exec plus stdout tokenization of the
+# nmcli/iwlist fallbacks below. python-gi isn't installed everywhere, so the
+# shell-out paths stay as the fallback.
+try:
+    import gi
+    gi.require_version('NM', '1.0')
+    from gi.repository import NM
+    NM_AVAILABLE = True
+except (ImportError, ValueError):
+    NM_AVAILABLE = False
+
+_nm_client = None
+_nm_client_lock = threading.Lock()
+
+def _get_nm_client():
+    """Lazy shared NM.Client - creating one opens the D-Bus connection"""
+    global _nm_client
+    with _nm_client_lock:
+        if _nm_client is None:
+            _nm_client = NM.Client.new(None)
+        return _nm_client
+
+def _nm_network_status():
+    """Network status read straight from NetworkManager over D-Bus"""
+    client = _get_nm_client()
+    connection = client.get_primary_connection()
+    if connection is None:
+        for candidate in client.get_active_connections():
+            if candidate.get_connection_type() != 'loopback':
+                connection = candidate
+                break
+    if connection is None:
+        return {
+            'connected': False,
+            'ssid': None,
+            'ip_address': None,
+            'mode': 'disconnected'
+        }
+
+    ip_address = None
+    ip4_config = connection.get_ip4_config()
+    if ip4_config is not None:
+        addresses = ip4_config.get_addresses()
+        if addresses:
+            ip_address = addresses[0].get_address()
+
+    conn_type = connection.get_connection_type() or ''
+    return {
+        'connected': True,
+        'ssid': connection.get_id(),
+        'ip_address': ip_address or 'Unknown',
+        'mode': 'wifi' if 'wireless' in conn_type else 'ethernet'
+    }
+
+def _nm_deactivate(match):
+    """Deactivate matching active connections over D-Bus.
+
+    match is a predicate over NM.ActiveConnection. Returns True if anything
+    was deactivated. Only deactivation has a synchronous libnm entry point;
+    connect and hotspot creation are async-only (they need a GLib main loop
+    for the callback), so those handlers stay on nmcli.
+    """
+    client = _get_nm_client()
+    deactivated = False
+    for active in list(client.get_active_connections()):
+        if match(active):
+            client.deactivate_connection(active, None)
+            deactivated = True
+    return deactivated
+
+def _nm_scan_wifi():
+    """WiFi networks from NetworkManager's access point list over D-Bus"""
+    client = _get_nm_client()
+    wifi_device = None
+    for device in client.get_devices():
+        if device.get_device_type() == NM.DeviceType.WIFI:
+            wifi_device = device
+            break
+    if wifi_device is None:
+        return []
+
+    # Nudge NM to rescan in the background; the AP list below is NM's
+    # current cache so this call never blocks on the scan itself
+    try:
+        wifi_device.request_scan_async(None, None)
+    except Exception:
+        pass
+
+    active_ap = wifi_device.get_active_access_point()
+    active_bssid = active_ap.get_bssid() if active_ap else None
+
+    unique_networks = {}
+    for ap in wifi_device.get_access_points():
+        ssid_bytes = ap.get_ssid()
+        if ssid_bytes is None:
+            continue
+        ssid = NM.utils_ssid_to_utf8(ssid_bytes.get_data())
+        if not ssid:
+            continue
+
+        network = {
+            'ssid': ssid,
+            'signal': int(ap.get_strength()),  # Already 0-100
+            'encrypted': bool(ap.get_wpa_flags() or ap.get_rsn_flags()),
+            'connected': active_bssid is not None and ap.get_bssid() == active_bssid
+        }
+
+        existing = unique_networks.get(ssid)
+        if existing is None or network['signal'] > existing['signal']:
+            if existing is not None and existing['connected']:
+                network['connected'] = True
+            unique_networks[ssid] = network
+
+    return sorted(unique_networks.values(), key=lambda x: x['signal'], reverse=True)
+
+# TTL cache for shell-out results. nmcli/iwlist take hundreds of ms per call
+# and the settings page polls these endpoints, so serve a recent result
+# instead of spawning a subprocess on every hit.
+NETWORK_STATUS_TTL = 10  # seconds
+WIFI_SCAN_TTL = 45  # seconds - scans are slow and the air changes slowly
+STORAGE_INFO_TTL = 5  # seconds - statvfs plus an lsblk walk per miss
+CURRENT_SSID_TTL = 3  # seconds - two subprocess forks per miss without NM
+
+_net_cache = {}  # {name: (value, expiry)}
+_net_cache_lock = threading.Lock()
+
+def _cached_call(name, ttl, compute, force=False):
+    """Return a cached result for `name`, recomputing if expired or forced"""
+    if not force:
+        with _net_cache_lock:
+            entry = _net_cache.get(name)
+            if entry is not None and entry[1] > time.time():
+                return entry[0]
+    value = compute()
+    with _net_cache_lock:
+        _net_cache[name] = (value, time.time() + ttl)
+    return value
+
+def _invalidate_net_cache():
+    """Drop cached results after a connect/disconnect/mount change"""
+    with _net_cache_lock:
+        _net_cache.clear()
+    with _mounts_cache_lock:
+        _mounts_cache['ts'] = 0.0
+        _mounts_cache['sig'] = None
+
+def _force_refresh_requested():
+    return request.args.get('refresh') in ('1', 'true')
+
 @network_api.route('/api/storage-info')
 def storage_info():
     try:
-        # Get internal storage info
-        statvfs = os.statvfs('.')
-        total = statvfs.f_frsize * statvfs.f_blocks
-        used = total - (statvfs.f_frsize * statvfs.f_bavail)
-        
-        internal_storage = {
-            'total': total,
-            'used': used,
-            'free': total - used
-        }
-        
-        # Get external storage info
-        external_storage = scan_external_storage()
-        
+        # ?with_usage=0 returns just the mount list (one small /proc/mounts
+        # read, no statvfs and no lsblk); usage is then fetched lazily per
+        # device via /api/external-storage-usage
+        if request.args.get('with_usage') == '0':
+            return jsonify({
+                'success': True,
+                'data': {'external': list_external_mounts()}
+            })
+
+        # Disk sizes don't change per second, so cache the statvfs plus the
+        # external device scan between polls (?refresh=1 bypasses)
+        data = _cached_call('storage_info', STORAGE_INFO_TTL,
+                            _collect_storage_info,
+                            force=_force_refresh_requested())
+
         return jsonify({
             'success': True,
-            'data': {
-                'internal': internal_storage,
-                'external': external_storage
-            }
+            'data': data
         })
-    
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@network_api.route('/api/external-storage-usage')
+def external_storage_usage():
+    """statvfs usage for one mounted device, fetched on demand"""
+    try:
+        path = request.args.get('path')
+        if not path:
+            return jsonify({'success': False, 'error': 'Path is required'}), 400
+
+        # Only stat paths that are actually in the mount table
+        if path not in {entry['path'] for entry in list_external_mounts()}:
+            return jsonify({'success': False, 'error': 'Not a mounted external device'}), 404
+
+        usage = get_mount_usage(path)
+        if usage is None:
+            return jsonify({'success': False, 'error': 'Device not accessible'}), 404
+
+        return jsonify({'success': True, 'usage': usage})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _collect_storage_info():
+    """Internal statvfs numbers plus the external device scan"""
+    statvfs = os.statvfs('.')
+    total = statvfs.f_frsize * statvfs.f_blocks
+    used = total - (statvfs.f_frsize * statvfs.f_bavail)
+
+    internal_storage = {
+        'total': total,
+        'used': used,
+        'free': total - used
+    }
+
+    return {
+        'internal': internal_storage,
+        'external': scan_external_storage()
+    }
+
 @network_api.route('/api/network-status')
 def network_status():
     try:
-        # Get actual network status using nmcli or ip commands
-        network_info = get_network_status()
+        # Get actual network status using nmcli or ip commands (cached;
+        # ?refresh=1 bypasses the cache)
+        network_info = _cached_call('network_status', NETWORK_STATUS_TTL,
+                                    get_network_status,
+                                    force=_force_refresh_requested())
         
         return jsonify({
             'success': True,
@@ -49,8 +242,10 @@ def network_status():
 @network_api.route('/api/wifi-networks')
 def wifi_networks():
     try:
-        # Scan for actual WiFi networks
-        networks = scan_wifi_networks()
+        # Scan for actual WiFi networks (cached; ?refresh=1 forces a rescan)
+        networks = _cached_call('wifi_networks', WIFI_SCAN_TTL,
+                                scan_wifi_networks,
+                                force=_force_refresh_requested())
         
         return jsonify({'success': True, 'networks': networks})
     
@@ -76,6 +271,7 @@ def connect_wifi():
         result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
 
         if result.returncode == 0:
+            _invalidate_net_cache()  # Status/scan results are stale now
             return jsonify({
                 'success': True,
                 'message': f'Connected to {ssid}'
@@ -98,9 +294,24 @@ def connect_wifi():
 @network_api.route('/api/disconnect-wifi', methods=['POST'])
 def disconnect_wifi():
     try:
-        result = subprocess.run(['sudo', 'nmcli', 'connection', 'down', 'id', 'wifi'],
-                              capture_output=True, text=True, timeout=10)
-        
+        if NM_AVAILABLE:
+            # Single D-Bus call on the long-lived client instead of forking nmcli
+            try:
+                _nm_deactivate(lambda a: 'wireless' in (a.get_connection_type() or ''))
+                _invalidate_net_cache()
+                return jsonify({
+                    'success': True,
+                    'message': 'Disconnected from WiFi'
+                })
+            except Exception:
+                pass  # Fall through to the nmcli shell-out
+
+        # nmcli --wait bounds the command itself, so no Python-side timeout
+        # watchdog is needed; close_fds=False keeps the posix_spawn fast path
+        result = subprocess.run(['sudo', 'nmcli', '--wait', '10', 'connection', 'down', 'id', 'wifi'],
+                              capture_output=True, text=True, close_fds=False)
+
+        _invalidate_net_cache()
         return jsonify({
             'success': True,
             'message': 'Disconnected from WiFi'
@@ -116,29 +327,27 @@ def configure_hotspot():
         ssid = data.get('ssid', 'DMX-Control-Hotspot')
         password = data.get('password', 'dmxcontrol123')
         
-        # Create hotspot using nmcli
-        result = subprocess.run([
-            'sudo', 'nmcli', 'connection', 'add', 'type', 'wifi', 'ifname', 'wlan0',
+        # Create and activate the hotspot in one subprocess instead of two
+        # sequential nmcli spawns; everything user-supplied is shell-quoted
+        add_cmd = [
+            'sudo', 'nmcli', '--wait', '10', 'connection', 'add', 'type', 'wifi', 'ifname', 'wlan0',
             'con-name', 'Hotspot', 'autoconnect', 'yes', 'ssid', ssid,
             'wifi.mode', 'ap', 'wifi.band', 'bg', 'ipv4.method', 'shared',
             'wifi-sec.key-mgmt', 'wpa-psk', 'wifi-sec.psk', password
-        ], capture_output=True, text=True, timeout=15)
-        
+        ]
+        up_cmd = ['sudo', 'nmcli', '--wait', '10', 'connection', 'up', 'Hotspot']
+        script = ' && '.join(' '.join(shlex.quote(arg) for arg in cmd)
+                             for cmd in (add_cmd, up_cmd))
+
+        result = subprocess.run(['sh', '-c', script],
+                              capture_output=True, text=True, close_fds=False)
+
         if result.returncode == 0:
-            # Activate the hotspot
-            activate_result = subprocess.run([
-                'sudo', 'nmcli', 'connection', 'up', 'Hotspot'
-            ], capture_output=True, text=True, timeout=10)
-            
-            if activate_result.returncode == 0:
-                return jsonify({
-                    'success': True,
-                    'message': f'Hotspot "{ssid}" configured and activated'
-                })
-            else:
-                return jsonify({
-                    'error': f'Hotspot configured but failed to activate: {activate_result.stderr.strip()}'
-                }), 500
+            _invalidate_net_cache()
+            return jsonify({
+                'success': True,
+                'message': f'Hotspot "{ssid}" configured and activated'
+            })
         else:
             return jsonify({
                 'error': f'Failed to configure hotspot: {result.stderr.strip()}'
@@ -150,9 +359,22 @@ def configure_hotspot():
 @network_api.route('/api/disable-hotspot', methods=['POST'])
 def disable_hotspot():
     try:
-        result = subprocess.run(['sudo', 'nmcli', 'connection', 'down', 'Hotspot'],
-                              capture_output=True, text=True, timeout=10)
+        if NM_AVAILABLE:
+            try:
+                _nm_deactivate(lambda a: a.get_id() == 'Hotspot')
+                _invalidate_net_cache()
+                return jsonify({
+                    'success': True,
+                    'message': 'Hotspot disabled'
+                })
+            except Exception:
+                pass  # Fall through to the nmcli shell-out
+
+        # Same as disconnect: let nmcli --wait enforce the bound
+        result = subprocess.run(['sudo', 'nmcli', '--wait', '10', 'connection', 'down', 'Hotspot'],
+                              capture_output=True, text=True, close_fds=False)
 
+        _invalidate_net_cache()
         return jsonify({
             'success': True,
             'message': 'Hotspot disabled'
@@ -191,6 +413,7 @@ def add_external_storage():
                               capture_output=True, text=True, timeout=10)
 
         if result.returncode == 0:
+            _invalidate_net_cache()  # Mounted set changed; drop cached storage info
             return jsonify({
                 'success': True,
                 'message': f'Device mounted at {mount_point}',
@@ -220,6 +443,7 @@ def remove_external_storage():
                               capture_output=True, text=True, timeout=10)
 
         if result.returncode == 0:
+            _invalidate_net_cache()
             return jsonify({
                 'success': True,
                 'message': 'External storage removed'
@@ -237,6 +461,12 @@ def remove_external_storage():
 # Network management helper functions
 def get_network_status():
     """Get current network connection status"""
+    if NM_AVAILABLE:
+        try:
+            return _nm_network_status()
+        except Exception:
+            pass  # Fall through to the nmcli/ip shell-outs
+
     try:
         # Try nmcli first (NetworkManager)
         result = subprocess.run(['nmcli', 'connection', 'show', '--active'], 
@@ -255,12 +485,13 @@ def get_network_status():
                                              capture_output=True, text=True, timeout=5)
                     ip_address = None
                     if ip_result.returncode == 0:
-                        for part in ip_result.stdout.split():
-                            if part.startswith('src'):
-                                ip_index = ip_result.stdout.split().index(part)
-                                if ip_index + 1 < len(ip_result.stdout.split()):
-                                    ip_address = ip_result.stdout.split()[ip_index + 1]
-                                    break
+                        # Tokenize once; the address follows the exact 'src'
+                        # token (startswith matched words like 'srcaddr' too)
+                        tokens = ip_result.stdout.split()
+                        for i, token in enumerate(tokens):
+                            if token == 'src' and i + 1 < len(tokens):
+                                ip_address = tokens[i + 1]
+                                break
                     
                     return {
                         'connected': True,
@@ -310,8 +541,14 @@ def get_network_status():
 
 def scan_wifi_networks():
     """Scan for available WiFi networks"""
+    if NM_AVAILABLE:
+        try:
+            return _nm_scan_wifi()
+        except Exception:
+            pass  # Fall through to the nmcli/iwlist shell-outs
+
     networks = []
-    
+
     try:
         # Try nmcli first (NetworkManager) - use newer format with explicit fields
         result = subprocess.run(['nmcli', '-f', 'BSSID,SSID,MODE,CHAN,FREQ,RATE,SIGNAL,BARS,SECURITY', 'device', 'wifi', 'list'], 
@@ -460,8 +697,29 @@ def scan_wifi_networks():
     
     return sorted(unique_networks.values(), key=lambda x: x.get('signal', 0), reverse=True)
 
+def _nm_current_ssid():
+    """SSID of the active access point, straight from NetworkManager"""
+    client = _get_nm_client()
+    for device in client.get_devices():
+        if device.get_device_type() == NM.DeviceType.WIFI:
+            ap = device.get_active_access_point()
+            if ap is not None:
+                ssid_bytes = ap.get_ssid()
+                if ssid_bytes is not None:
+                    return NM.utils_ssid_to_utf8(ssid_bytes.get_data())
+    return None
+
 def get_current_ssid():
-    """Get currently connected WiFi SSID"""
+    """Get currently connected WiFi SSID (cached briefly between callers)"""
+    return _cached_call('current_ssid', CURRENT_SSID_TTL, _detect_current_ssid)
+
+def _detect_current_ssid():
+    if NM_AVAILABLE:
+        try:
+            return _nm_current_ssid()
+        except Exception:
+            pass  # Fall through to the nmcli/iwgetid shell-outs
+
     try:
         result = subprocess.run(['nmcli', 'connection', 'show', '--active'], 
                               capture_output=True, text=True, timeout=5)
@@ -483,44 +741,116 @@ def get_current_ssid():
     
     return None
 
-def scan_external_storage():
-    """Scan for all external storage devices (mounted and unmounted)"""
-    external_devices = []
-    mounted_devices = {}
+# Mount table cache for scan_external_storage. The mounted-device pass runs
+# statvfs per mount point; within the TTL the previous scan is reused, and
+# after it a single /proc/mounts read plus a signature compare decides
+# whether the statvfs pass needs to run at all.
+MOUNTS_TTL = 2.0  # seconds
+
+_mounts_cache = {'ts': 0.0, 'sig': None, 'mounted': {}, 'result': []}
+_mounts_cache_lock = threading.Lock()
 
+USB_MOUNT_PREFIXES = ('/media/', '/mnt/', '/run/media/')
+
+def _read_proc_mounts():
+    """Raw /proc/mounts bytes via plain openat/read/close.
+
+    The buffered file-object path adds fstat/ioctl/lseek syscalls that buy
+    nothing for a small, unseekable procfs entry; one read usually grabs
+    the whole table, with a loop in case it ever doesn't.
+    """
+    fd = os.open('/proc/mounts', os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+def get_mount_usage(mount_point):
+    """statvfs totals for one mount point, or None if it can't be statted"""
+    try:
+        statvfs = os.statvfs(mount_point)
+    except OSError:
+        return None
+    total = statvfs.f_frsize * statvfs.f_blocks
+    used = total - (statvfs.f_frsize * statvfs.f_bavail)
+    return {'total': total, 'used': used, 'free': total - used}
+
+def list_external_mounts():
+    """USB-style mount points from /proc/mounts - no statvfs, no lsblk"""
+    entries = []
     try:
-        # First, get info about mounted devices
-        with open('/proc/mounts', 'r') as f:
-            mounts = f.read()
+        mounts = _read_proc_mounts().decode()
+    except OSError:
+        return entries
+
+    for line in mounts.split('\n'):
+        parts = line.split()
+        if len(parts) >= 3 and parts[1].startswith(USB_MOUNT_PREFIXES):
+            entries.append({
+                'device': parts[0],
+                'path': parts[1],
+                'name': os.path.basename(parts[1]),
+                'filesystem': parts[2],
+                'mounted': True
+            })
+    return entries
 
-        usb_patterns = ['/media/', '/mnt/', '/run/media/']
+def _parse_mounted_devices(mounts):
+    """statvfs info for every USB-style mount point in a /proc/mounts dump"""
+    mounted_devices = {}
+    for line in mounts.split('\n'):
+        if not line.strip():
+            continue
 
-        for line in mounts.split('\n'):
-            if not line.strip():
-                continue
+        parts = line.split()
+        if len(parts) >= 3:
+            device, mount_point, fs_type = parts[:3]
 
-            parts = line.split()
-            if len(parts) >= 3:
-                device, mount_point, fs_type = parts[:3]
+            if mount_point.startswith(USB_MOUNT_PREFIXES):
+                usage = get_mount_usage(mount_point)
+                if usage is None:
+                    continue
 
-                if any(mount_point.startswith(pattern) for pattern in usb_patterns):
-                    try:
-                        statvfs = os.statvfs(mount_point)
-                        total = statvfs.f_frsize * statvfs.f_blocks
-                        used = total - (statvfs.f_frsize * statvfs.f_bavail)
-
-                        mounted_devices[device] = {
-                            'device': device,
-                            'path': mount_point,
-                            'name': os.path.basename(mount_point),
-                            'filesystem': fs_type,
-                            'total': total,
-                            'used': used,
-                            'free': total - used,
-                            'mounted': True
-                        }
-                    except OSError:
-                        continue
+                mounted_devices[device] = {
+                    'device': device,
+                    'path': mount_point,
+                    'name': os.path.basename(mount_point),
+                    'filesystem': fs_type,
+                    'mounted': True,
+                    **usage
+                }
+    return mounted_devices
+
+def scan_external_storage():
+    """Scan for all external storage devices (mounted and unmounted)"""
+    now = time.monotonic()
+    with _mounts_cache_lock:
+        if now - _mounts_cache['ts'] < MOUNTS_TTL:
+            return _mounts_cache['result']
+        cached_sig = _mounts_cache['sig']
+
+    external_devices = []
+    mounted_devices = {}
+    sig = None
+
+    try:
+        # Read the mount table once; if it hasn't changed since last scan,
+        # reuse the previous statvfs results instead of re-statting every
+        # mount point
+        raw_mounts = _read_proc_mounts()
+
+        sig = hashlib.blake2b(raw_mounts, digest_size=8).digest()
+        if sig == cached_sig:
+            with _mounts_cache_lock:
+                mounted_devices = _mounts_cache['mounted']
+        else:
+            mounted_devices = _parse_mounted_devices(raw_mounts.decode())
     except Exception:
         pass
 
@@ -582,6 +912,12 @@ def scan_external_storage():
         # Fallback to mounted devices only if lsblk fails
         external_devices = list(mounted_devices.values())
 
+    with _mounts_cache_lock:
+        _mounts_cache['ts'] = time.monotonic()
+        _mounts_cache['sig'] = sig
+        _mounts_cache['mounted'] = mounted_devices
+        _mounts_cache['result'] = external_devices
+
     return external_devices
 
 def parse_size_string(size_str):
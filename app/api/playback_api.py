@@ -1,16 +1,38 @@
+import base64
+import logging
+import threading
 import time
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from sqlalchemy.orm import joinedload
 from app.models.models import Sequence, Song, PatchedDevice, db
 from app.services import playback
 
+log = logging.getLogger(__name__)
+
 playback_api = Blueprint('playback_api', __name__)
 
+# Channel offsets grouped by type, cached across requests and keyed on the
+# raw channels JSON so a device edit invalidates its entry naturally
+_channel_offsets_cache = {}
+
+def _get_channel_offsets(device):
+    """{channel_type: [offset, ...]} for a device, cached across requests"""
+    cached = _channel_offsets_cache.get(device.id)
+    if cached is not None and cached[0] == device.channels:
+        return cached[1]
+    offsets = {}
+    for i, channel in enumerate(device.get_channels()):
+        offsets.setdefault(channel.get('type'), []).append(i)
+    _channel_offsets_cache[device.id] = (device.channels, offsets)
+    return offsets
+
 @playback_api.route('/api/play-sequence', methods=['POST'])
 def play_sequence_endpoint():
     try:
         data = request.get_json()
-        print(f"Received data: {data}")  # Debug logging
-        
+        # %s-style is lazy: with DEBUG off the body is never stringified
+        log.debug("play request: %s", data)
+
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
@@ -51,7 +73,7 @@ def play_sequence_endpoint():
         return jsonify({'error': 'Either sequence_id or song_id is required'}), 400
     
     except Exception as e:
-        print(f"Error in play_sequence_endpoint: {e}")  # Debug logging
+        log.exception("play_sequence_endpoint failed")
         return jsonify({'error': str(e)}), 500
 
 @playback_api.route('/api/play-sequence-by-id', methods=['POST'])
@@ -148,17 +170,21 @@ def master_dimmer():
         data = request.get_json()
         value = data.get('value', 100)
         
-        # Apply dimmer to all patched dimmer channels
-        patches = PatchedDevice.query.all()
+        # Apply dimmer to all patched dimmer channels. Devices are joined in
+        # one query and channels parsed once per device, not per patch
+        patches = PatchedDevice.query.options(joinedload(PatchedDevice.device)).all()
+        # Read the universe once and push all scaled values back in a single
+        # locked update instead of a get/set lock round-trip per channel
+        snapshot = playback.dmx_controller.get_channels_snapshot()
+        writes = {}
         for patch in patches:
-            channels = patch.device.get_channels()
-            for i, channel in enumerate(channels):
-                if channel.get('type') == 'dimmer_channel':
-                    dmx_address = patch.start_address + i
-                    current_value = playback.dmx_controller.get_channel(dmx_address)
-                    new_value = int(current_value * value / 100)
-                    playback.dmx_controller.set_channel(dmx_address, new_value)
-        
+            for i in _get_channel_offsets(patch.device).get('dimmer_channel', ()):
+                dmx_address = patch.start_address + i
+                if 1 <= dmx_address <= 512:
+                    writes[dmx_address] = snapshot[dmx_address - 1] * value // 100
+        if writes:
+            playback.dmx_controller.set_channels(writes)
+
         return jsonify({'success': True})
     
     except Exception as e:
@@ -176,38 +202,109 @@ def master_color():
         g = int(color_hex[2:4], 16)
         b = int(color_hex[4:6], 16)
         
-        # Apply color to all patched color channels
-        patches = PatchedDevice.query.all()
+        # Apply color to all patched color channels (same batching as
+        # master_dimmer: one joined query, one parse per device)
+        patches = PatchedDevice.query.options(joinedload(PatchedDevice.device)).all()
+        rgb = {'red_channel': r, 'green_channel': g, 'blue_channel': b}
+        writes = {}
         for patch in patches:
-            channels = patch.device.get_channels()
-            for i, channel in enumerate(channels):
-                dmx_address = patch.start_address + i
-                channel_type = channel.get('type')
-                
-                if channel_type == 'red_channel':
-                    playback.dmx_controller.set_channel(dmx_address, r)
-                elif channel_type == 'green_channel':
-                    playback.dmx_controller.set_channel(dmx_address, g)
-                elif channel_type == 'blue_channel':
-                    playback.dmx_controller.set_channel(dmx_address, b)
-        
+            offsets = _get_channel_offsets(patch.device)
+            for channel_type, color_value in rgb.items():
+                for i in offsets.get(channel_type, ()):
+                    writes[patch.start_address + i] = color_value
+        if writes:
+            # One locked update for the whole rig
+            playback.dmx_controller.set_channels(writes)
+
         return jsonify({'success': True})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Last served universe for /api/dmx-status: the poller mostly sees an idle
+# rig, so an unchanged universe is answered with 304 instead of a new body
+_dmx_status_cache = {'body': None, 'etag': None}
+
 @playback_api.route('/api/dmx-status')
 def get_dmx_status():
-    """Get current DMX channel values for real-time monitoring"""
+    """Current DMX universe as 512 raw bytes for real-time monitoring.
+
+    Binary instead of JSON: 512 bytes on the wire rather than a ~2KB array
+    of ints, and no per-channel serialization. Clients read the body as a
+    Uint8Array (channel N is byte N-1) and can send If-None-Match to skip
+    the transfer entirely while nothing changes.
+    """
     try:
-        return jsonify({
-            'success': True,
-            'channels': playback.dmx_controller.dmx_data,
-            'timestamp': time.time()
-        })
+        body = playback.dmx_controller.get_channels_snapshot()
+        cache = _dmx_status_cache
+        if body != cache['body']:
+            cache['etag'] = f'"{hash(body) & 0xffffffffffffffff:016x}"'
+            cache['body'] = body
+
+        if request.headers.get('If-None-Match') == cache['etag']:
+            return Response(status=304, headers={'ETag': cache['etag']})
+
+        return Response(cache['body'], mimetype='application/octet-stream',
+                        headers={'ETag': cache['etag'],
+                                 'X-Timestamp': str(time.time())})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Each open stream pins one WSGI worker thread for its whole lifetime, and
+# waitress runs a fixed pool of 8 — unbounded subscribers would let a handful
+# of dashboard tabs starve every other request. Keep well under half the pool.
+MAX_DMX_STREAM_SUBSCRIBERS = 3
+_dmx_stream_subscribers = {'count': 0}
+_dmx_stream_lock = threading.Lock()
+
+@playback_api.route('/api/dmx-stream')
+def dmx_stream():
+    """Server-sent DMX universe updates, pushed only when channels change.
+
+    An alternative to tight polling of /api/dmx-status: the connection sits
+    on a condition the DMX output thread notifies at most once per frame, so
+    an idle rig costs nothing and an active one delivers one event per
+    changed frame. Each event's data is the 512-byte universe, base64-encoded
+    (EventSource payloads must be text). Subscribers are capped because each
+    stream occupies a worker thread until the client disconnects; rejected
+    clients should fall back to polling /api/dmx-status.
+    """
+    with _dmx_stream_lock:
+        if _dmx_stream_subscribers['count'] >= MAX_DMX_STREAM_SUBSCRIBERS:
+            return jsonify({'error': 'Too many stream subscribers, '
+                                     'poll /api/dmx-status instead'}), 503
+        _dmx_stream_subscribers['count'] += 1
+
+    def generate():
+        controller = playback.dmx_controller
+        last = None
+        idle_waits = 0
+        try:
+            while True:
+                snapshot = controller.get_channels_snapshot()
+                if snapshot != last:
+                    last = snapshot
+                    idle_waits = 0
+                    yield b'data: ' + base64.b64encode(snapshot) + b'\n\n'
+                else:
+                    idle_waits += 1
+                    if idle_waits >= 15:
+                        idle_waits = 0
+                        yield b': keepalive\n\n'
+                # The 1s timeout doubles as a fallback poll when no hardware
+                # output thread is running to notify (e.g. no UART on dev boxes)
+                with controller.change_condition:
+                    controller.change_condition.wait(timeout=1.0)
+        finally:
+            # Runs when the client disconnects and the generator is closed
+            with _dmx_stream_lock:
+                _dmx_stream_subscribers['count'] -= 1
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
 @playback_api.route('/api/set-dmx-channels', methods=['POST'])
 def set_dmx_channels():
     """Set multiple DMX channels at once (for editor preview)"""
@@ -234,7 +331,7 @@ def test_dmx():
         channel = data.get('channel', 1)
         value = data.get('value', 255)
 
-        print(f"[TEST] Setting DMX channel {channel} to {value}")
+        log.debug("[TEST] Setting DMX channel %s to %s", channel, value)
         playback.dmx_controller.set_channel(channel, value)
 
         # Wait a moment and read it back
@@ -1,11 +1,60 @@
 import os
 import json
+import orjson
+import fastjsonschema
 from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
+from sqlalchemy import text, update
+from sqlalchemy.orm import joinedload
 from app.models.models import Sequence, Song, Playlist, db
 
 sequence_api = Blueprint('sequence_api', __name__)
 
+# Compiled once at import time; validation runs as generated code instead
+# of a Python loop over every event
+_validate_sequence_import = fastjsonschema.compile({
+    'type': 'object',
+    'required': ['name', 'song_id', 'events'],
+    'properties': {
+        'events': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['time', 'channel', 'value']
+            }
+        }
+    }
+})
+
+def _update_playlist_sequences(playlist_id, mutate):
+    """Read-modify-write a playlist's sequence list without lost updates.
+
+    mutate(sequences) edits the list in place and returns True if anything
+    changed. The UPDATE is guarded by the playlist's version counter, so a
+    concurrent writer that got in between our read and write makes the
+    statement match zero rows and we retry with fresh data. Returns the
+    playlist, or None if it doesn't exist.
+    """
+    for _ in range(5):
+        playlist = db.session.get(Playlist, playlist_id)
+        if not playlist:
+            return None
+        sequences = list(playlist.get_sequences())
+        if not mutate(sequences):
+            return playlist  # Nothing to write
+        expected_version = playlist.version or 0
+        result = db.session.execute(
+            update(Playlist)
+            .where(Playlist.id == playlist_id, Playlist.version == expected_version)
+            .values(sequences=json.dumps(sequences), version=expected_version + 1))
+        if result.rowcount:
+            db.session.commit()
+            return playlist
+        # Lost the race - reload and try again
+        db.session.rollback()
+        db.session.expire(playlist)
+    raise RuntimeError('Playlist update kept conflicting with concurrent writers')
+
 @sequence_api.route('/api/save-sequence', methods=['POST'])
 def save_sequence():
     try:
@@ -41,10 +90,11 @@ def save_sequence():
 @sequence_api.route('/api/get-sequence/<int:sequence_id>')
 def get_sequence(sequence_id):
     try:
-        sequence = db.session.get(Sequence, sequence_id)
+        # Join the song in up front - the response reads sequence.song.*
+        sequence = Sequence.query.options(joinedload(Sequence.song)).filter_by(id=sequence_id).first()
         if not sequence:
             return jsonify({'error': 'Sequence not found'}), 404
-        
+
         return jsonify({
             'success': True,
             'sequence': {
@@ -55,8 +105,8 @@ def get_sequence(sequence_id):
                 'song': {
                     'id': sequence.song.id,
                     'name': sequence.song.name,
-                    'duration': sequence.song.duration,
-                    'waveform_data': json.loads(sequence.song.waveform_data) if sequence.song.waveform_data else []
+                    'duration': sequence.song.duration
+                    # Waveform comes from /api/waveform/<id> as binary float32
                 }
             }
         })
@@ -74,8 +124,10 @@ def delete_sequence():
         if not sequence:
             return jsonify({'error': 'Sequence not found'}), 404
         
-        # Remove from playlists
-        playlists = Playlist.query.all()
+        # Remove from playlists. Prefilter in SQL so only playlists whose
+        # JSON mentions the id get loaded and parsed; the Python membership
+        # check below still decides exactly (id 1 substring-matches id 12)
+        playlists = Playlist.query.filter(Playlist.sequences.like(f'%{sequence_id}%')).all()
         for playlist in playlists:
             sequences = playlist.get_sequences()
             if sequence_id in sequences:
@@ -98,20 +150,22 @@ def duplicate_sequence():
         sequence_id = data.get('sequence_id')
         new_name = data.get('new_name')
         
-        original = db.session.get(Sequence, sequence_id)
-        if not original:
+        # Copy the row inside the database: one INSERT ... SELECT instead of
+        # marshalling the (potentially multi-MB) events JSON into Python and
+        # back. RETURNING also doubles as the existence check
+        row = db.session.execute(text(
+            "INSERT INTO sequence (song_id, name, events, created_at) "
+            "SELECT song_id, :name, events, :now FROM sequence WHERE id = :id "
+            "RETURNING id"
+        ), {'name': new_name, 'id': sequence_id, 'now': datetime.utcnow()}).first()
+
+        if row is None:
+            db.session.rollback()
             return jsonify({'error': 'Sequence not found'}), 404
-        
-        duplicate = Sequence(
-            song_id=original.song_id,
-            name=new_name,
-            events=original.events
-        )
-        
-        db.session.add(duplicate)
+
         db.session.commit()
-        
-        return jsonify({'success': True, 'sequence_id': duplicate.id})
+
+        return jsonify({'success': True, 'sequence_id': row.id})
     
     except Exception as e:
         db.session.rollback()
@@ -178,11 +232,13 @@ def toggle_playlist():
         playlist_id = data.get('playlist_id')
         is_active = data.get('is_active')
         
-        playlist = db.session.get(Playlist, playlist_id)
-        if not playlist:
+        # One UPDATE instead of SELECT-then-UPDATE; rowcount tells us
+        # whether the playlist existed
+        result = db.session.execute(
+            update(Playlist).where(Playlist.id == playlist_id).values(is_active=is_active))
+        if result.rowcount == 0:
+            db.session.rollback()
             return jsonify({'error': 'Playlist not found'}), 404
-        
-        playlist.is_active = is_active
         db.session.commit()
         
         return jsonify({'success': True})
@@ -198,11 +254,11 @@ def toggle_random_mode():
         playlist_id = data.get('playlist_id')
         random_mode = data.get('random_mode')
         
-        playlist = db.session.get(Playlist, playlist_id)
-        if not playlist:
+        result = db.session.execute(
+            update(Playlist).where(Playlist.id == playlist_id).values(random_mode=random_mode))
+        if result.rowcount == 0:
+            db.session.rollback()
             return jsonify({'error': 'Playlist not found'}), 404
-        
-        playlist.random_mode = random_mode
         db.session.commit()
         
         return jsonify({'success': True})
@@ -221,24 +277,24 @@ def add_to_playlist():
         if not playlist_id or not sequence_ids:
             return jsonify({'error': 'Playlist ID and Sequence IDs are required'}), 400
         
-        playlist = db.session.get(Playlist, playlist_id)
-        if not playlist:
-            return jsonify({'error': 'Playlist not found'}), 404
-        
         # Validate all sequences exist
         for sequence_id in sequence_ids:
             sequence = db.session.get(Sequence, sequence_id)
             if not sequence:
                 return jsonify({'error': f'Sequence {sequence_id} not found'}), 404
-        
-        sequences = playlist.get_sequences()
-        for sequence_id in sequence_ids:
-            if sequence_id not in sequences:
-                sequences.append(sequence_id)
-        
-        playlist.set_sequences(sequences)
-        db.session.commit()
-        
+
+        def add_missing(sequences):
+            added = False
+            for sequence_id in sequence_ids:
+                if sequence_id not in sequences:
+                    sequences.append(sequence_id)
+                    added = True
+            return added
+
+        playlist = _update_playlist_sequences(playlist_id, add_missing)
+        if not playlist:
+            return jsonify({'error': 'Playlist not found'}), 404
+
         return jsonify({'success': True})
     
     except Exception as e:
@@ -255,16 +311,16 @@ def remove_from_playlist():
         if not playlist_id or not sequence_id:
             return jsonify({'error': 'Playlist ID and Sequence ID are required'}), 400
         
-        playlist = db.session.get(Playlist, playlist_id)
+        def remove_if_present(sequences):
+            if sequence_id in sequences:
+                sequences.remove(sequence_id)
+                return True
+            return False
+
+        playlist = _update_playlist_sequences(playlist_id, remove_if_present)
         if not playlist:
             return jsonify({'error': 'Playlist not found'}), 404
-        
-        sequences = playlist.get_sequences()
-        if sequence_id in sequences:
-            sequences.remove(sequence_id)
-            playlist.set_sequences(sequences)
-            db.session.commit()
-        
+
         return jsonify({'success': True})
     
     except Exception as e:
@@ -285,30 +341,25 @@ def import_sequence():
             return jsonify({'error': 'Only JSON files are supported'}), 400
         
         try:
-            sequence_data = json.loads(file.read().decode('utf-8'))
-        except json.JSONDecodeError:
+            # orjson parses the uploaded bytes directly - no separate
+            # UTF-8 decode pass into a throwaway str
+            sequence_data = orjson.loads(file.read())
+        except orjson.JSONDecodeError:
             return jsonify({'error': 'Invalid JSON format'}), 400
         
-        # Validate required fields
-        required_fields = ['name', 'song_id', 'events']
-        for field in required_fields:
-            if field not in sequence_data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
+        # Validate structure (required fields and event shape) in one pass
+        try:
+            _validate_sequence_import(sequence_data)
+        except fastjsonschema.JsonSchemaException as e:
+            return jsonify({'error': f'Invalid sequence file: {e.message}'}), 400
+
         # Validate song exists
         song = db.session.get(Song, sequence_data['song_id'])
         if not song:
             return jsonify({'error': 'Referenced song not found'}), 404
-        
-        # Validate events format
+
         events = sequence_data['events']
-        if not isinstance(events, list):
-            return jsonify({'error': 'Events must be an array'}), 400
-        
-        for event in events:
-            if not all(key in event for key in ['time', 'channel', 'value']):
-                return jsonify({'error': 'Each event must have time, channel, and value'}), 400
-        
+
         # Create new sequence
         sequence = Sequence(
             song_id=sequence_data['song_id'],
@@ -328,43 +379,47 @@ def import_sequence():
 @sequence_api.route('/api/export-sequences')
 def export_sequences():
     try:
-        from flask import current_app
-        
         sequence_ids = request.args.get('ids', '').split(',')
+        # Join songs in one query - the loop below reads sequence.song.name,
+        # which would otherwise lazy-load per sequence
+        query = Sequence.query.options(joinedload(Sequence.song))
         if not sequence_ids or sequence_ids == ['']:
             # Export all sequences if no IDs specified
-            sequences = Sequence.query.all()
+            sequences = query.all()
         else:
             # Export specific sequences
-            sequences = Sequence.query.filter(Sequence.id.in_(sequence_ids)).all()
+            sequences = query.filter(Sequence.id.in_(sequence_ids)).all()
         
         if not sequences:
             return jsonify({'error': 'No sequences found'}), 404
         
-        export_data = []
-        for sequence in sequences:
-            export_data.append({
-                'id': sequence.id,
-                'name': sequence.name,
-                'song_id': sequence.song_id,
-                'song_name': sequence.song.name,
-                'events': sequence.get_events(),
-                'created_at': sequence.created_at.isoformat()
-            })
-        
         # Create export filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'sequences_export_{timestamp}.json'
-        
-        # Save to temporary file
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        export_path = os.path.join(upload_folder, filename)
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        with open(export_path, 'w') as f:
-            json.dump(export_data, f, indent=2)
-        
-        return send_file(export_path, as_attachment=True, download_name=filename)
+
+        # Stream one sequence at a time straight to the client - no temp
+        # file in the uploads folder and never more than one sequence
+        # serialized in memory
+        def generate():
+            yield b'['
+            for index, sequence in enumerate(sequences):
+                if index:
+                    yield b',\n'
+                yield orjson.dumps({
+                    'id': sequence.id,
+                    'name': sequence.name,
+                    'song_id': sequence.song_id,
+                    'song_name': sequence.song.name,
+                    'events': sequence.get_events(),
+                    'created_at': sequence.created_at.isoformat()
+                })
+            yield b']'
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/json',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -1,3 +1,4 @@
+import errno
 import os
 import json
 import subprocess
@@ -6,29 +7,90 @@ import time
 import threading
 import shutil
 from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
+from sqlalchemy import select
 from app.models.models import Device, PatchedDevice, Playlist, db
 
 system_api = Blueprint('system_api', __name__)
 
+# Single source of truth for settings fields and their defaults, shared by
+# the read handler (defaults merge) and the save handlers (dict build)
+SYSTEM_SETTINGS_SCHEMA = (
+    ('device_name', 'DMX Control System'),
+    ('auto_start', True),
+    ('dmx_refresh_rate', 25),
+    ('audio_buffer_size', 1024),
+    ('max_sequences', 100),
+    ('backup_enabled', True),
+    ('debug_mode', False),
+    ('dark_mode', False),
+    ('button_lock_duration', 0),  # 0 = disabled, otherwise lock duration in seconds
+    ('button_lock_trigger', 'after_press'),  # 'after_press' or 'after_sequence'
+)
+
+SECURITY_SETTINGS_SCHEMA = (
+    ('authentication_enabled', False),
+    ('password_hash', ''),
+    ('session_timeout', 3600),
+)
+
+# One encoder instance for every config write: json.dump(indent=2) rebuilds
+# the encoder (and skips the C fast path) on each call
+_json_encoder = json.JSONEncoder(indent=2, separators=(',', ': '), ensure_ascii=False)
+
+# Parsed config files keyed on (mtime_ns, size): repeat reads cost one stat
+# instead of open/read/parse, and an edit on disk invalidates naturally
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+
+def _load_json_cached(path):
+    """Parse a JSON config file, reusing the cached parse while unchanged.
+
+    Returns None if the file doesn't exist. Callers must not mutate the
+    returned dict - it is shared across requests.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    with _config_cache_lock:
+        entry = _config_cache.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+    with open(path, 'rb') as f:
+        data = json.loads(f.read())
+    with _config_cache_lock:
+        _config_cache[path] = (key, data)
+    return data
+
+def _store_json_config(path, settings):
+    """Write a config file atomically and refresh the cache without a re-read.
+
+    Writing a sibling tmp file and renaming it over the target means a crash
+    or a racing save can never leave a half-written file behind - readers
+    always see either the old or the new contents. No fsync: these are
+    cosmetic settings, not worth stalling the request on a disk flush.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(_json_encoder.encode(settings))
+    os.replace(tmp_path, path)
+    st = os.stat(path)
+    with _config_cache_lock:
+        _config_cache[path] = ((st.st_mtime_ns, st.st_size), settings)
+
 @system_api.route('/api/get-dark-mode')
 def get_dark_mode():
     try:
         config_dir = os.path.expanduser('~/.dmx_control')
         config_file = os.path.join(config_dir, 'system.json')
         
-        if os.path.exists(config_file):
-            with open(config_file, 'r') as f:
-                settings = json.load(f)
-                return jsonify({
-                    'success': True,
-                    'dark_mode': settings.get('dark_mode', False)
-                })
-        else:
-            return jsonify({
-                'success': True,
-                'dark_mode': False
-            })
+        settings = _load_json_cached(config_file)
+        return jsonify({
+            'success': True,
+            'dark_mode': settings.get('dark_mode', False) if settings else False
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -42,16 +104,12 @@ def save_security_settings():
         os.makedirs(config_dir, exist_ok=True)
         config_file = os.path.join(config_dir, 'security.json')
         
-        settings = {
-            'authentication_enabled': data.get('authentication_enabled', False),
-            'password_hash': data.get('password_hash', ''),
-            'session_timeout': data.get('session_timeout', 3600),
-            'updated_at': datetime.now().isoformat()
-        }
-        
-        with open(config_file, 'w') as f:
-            json.dump(settings, f, indent=2)
-        
+        settings = {key: data.get(key, default)
+                    for key, default in SECURITY_SETTINGS_SCHEMA}
+        settings['updated_at'] = datetime.now().isoformat()
+
+        _store_json_config(config_file, settings)
+
         return jsonify({
             'success': True,
             'message': 'Security settings saved'
@@ -66,28 +124,11 @@ def system_settings():
         config_dir = os.path.expanduser('~/.dmx_control')
         config_file = os.path.join(config_dir, 'system.json')
         
-        default_settings = {
-            'device_name': 'DMX Control System',
-            'auto_start': True,
-            'dmx_refresh_rate': 25,
-            'audio_buffer_size': 1024,
-            'max_sequences': 100,
-            'backup_enabled': True,
-            'debug_mode': False,
-            'dark_mode': False,
-            'button_lock_duration': 0,  # 0 = disabled, otherwise lock duration in seconds
-            'button_lock_trigger': 'after_press'  # 'after_press' or 'after_sequence'
-        }
-        
-        if os.path.exists(config_file):
-            with open(config_file, 'r') as f:
-                settings = json.load(f)
-                # Merge with defaults for missing keys
-                for key, value in default_settings.items():
-                    if key not in settings:
-                        settings[key] = value
-        else:
-            settings = default_settings
+        default_settings = dict(SYSTEM_SETTINGS_SCHEMA)
+
+        # Merge into a copy so the shared cached dict is never mutated
+        stored = _load_json_cached(config_file)
+        settings = {**default_settings, **stored} if stored else default_settings
         
         return jsonify({
             'success': True,
@@ -106,23 +147,12 @@ def save_system_settings():
         os.makedirs(config_dir, exist_ok=True)
         config_file = os.path.join(config_dir, 'system.json')
         
-        settings = {
-            'device_name': data.get('device_name', 'DMX Control System'),
-            'auto_start': data.get('auto_start', True),
-            'dmx_refresh_rate': data.get('dmx_refresh_rate', 25),
-            'audio_buffer_size': data.get('audio_buffer_size', 1024),
-            'max_sequences': data.get('max_sequences', 100),
-            'backup_enabled': data.get('backup_enabled', True),
-            'debug_mode': data.get('debug_mode', False),
-            'dark_mode': data.get('dark_mode', False),
-            'button_lock_duration': data.get('button_lock_duration', 0),
-            'button_lock_trigger': data.get('button_lock_trigger', 'after_press'),
-            'updated_at': datetime.now().isoformat()
-        }
-        
-        with open(config_file, 'w') as f:
-            json.dump(settings, f, indent=2)
-        
+        settings = {key: data.get(key, default)
+                    for key, default in SYSTEM_SETTINGS_SCHEMA}
+        settings['updated_at'] = datetime.now().isoformat()
+
+        _store_json_config(config_file, settings)
+
         return jsonify({
             'success': True,
             'message': 'System settings saved'
@@ -134,10 +164,8 @@ def save_system_settings():
 @system_api.route('/api/export-all-settings')
 def export_all_settings():
     try:
-        from flask import current_app
-        
         config_dir = os.path.expanduser('~/.dmx_control')
-        
+
         # Collect all settings
         all_settings = {
             'exported_at': datetime.now().isoformat(),
@@ -145,46 +173,58 @@ def export_all_settings():
         }
         
         # Load system settings
-        system_file = os.path.join(config_dir, 'system.json')
-        if os.path.exists(system_file):
-            with open(system_file, 'r') as f:
-                all_settings['system'] = json.load(f)
-        
-        # Load security settings (excluding sensitive data)
-        security_file = os.path.join(config_dir, 'security.json')
-        if os.path.exists(security_file):
-            with open(security_file, 'r') as f:
-                security_settings = json.load(f)
-                # Remove sensitive data
-                security_settings.pop('password_hash', None)
-                all_settings['security'] = security_settings
-        
-        # Export database data
-        devices = [{'id': d.id, 'name': d.name, 'channels': d.get_channels()} 
-                  for d in Device.query.all()]
-        all_settings['devices'] = devices
-        
-        patched_devices = [{'id': p.id, 'device_id': p.device_id, 'start_address': p.start_address,
-                           'x_position': p.x_position, 'y_position': p.y_position} 
-                          for p in PatchedDevice.query.all()]
-        all_settings['patched_devices'] = patched_devices
-        
-        playlists = [{'id': p.id, 'name': p.name, 'sequences': p.get_sequences()}
-                    for p in Playlist.query.all()]
-        all_settings['playlists'] = playlists
-        
-        # Create export file
+        system_settings_data = _load_json_cached(os.path.join(config_dir, 'system.json'))
+        if system_settings_data is not None:
+            all_settings['system'] = system_settings_data
+
+        # Load security settings (excluding sensitive data); copy before the
+        # pop so the cached dict keeps its password_hash
+        security_settings = _load_json_cached(os.path.join(config_dir, 'security.json'))
+        if security_settings is not None:
+            security_settings = dict(security_settings)
+            security_settings.pop('password_hash', None)
+            all_settings['security'] = security_settings
+        
+        # Export database data. Select only the exported columns instead of
+        # hydrating full ORM objects, and parse the JSON columns inline; no
+        # autoflush since these are pure reads
+        with db.session.no_autoflush:
+            all_settings['devices'] = [
+                {'id': row.id, 'name': row.name,
+                 'channels': json.loads(row.channels) if row.channels else []}
+                for row in db.session.execute(
+                    select(Device.id, Device.name, Device.channels))
+            ]
+
+            all_settings['patched_devices'] = [
+                {'id': row.id, 'device_id': row.device_id,
+                 'start_address': row.start_address,
+                 'x_position': row.x_position, 'y_position': row.y_position}
+                for row in db.session.execute(
+                    select(PatchedDevice.id, PatchedDevice.device_id,
+                           PatchedDevice.start_address,
+                           PatchedDevice.x_position, PatchedDevice.y_position))
+            ]
+
+            all_settings['playlists'] = [
+                {'id': row.id, 'name': row.name,
+                 'sequences': json.loads(row.sequences) if row.sequences else []}
+                for row in db.session.execute(
+                    select(Playlist.id, Playlist.name, Playlist.sequences))
+            ]
+        
+        # Stream the JSON straight into the response instead of writing a
+        # temp file to UPLOAD_FOLDER and reading it back; nothing is left
+        # behind on disk either
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'dmx_settings_export_{timestamp}.json'
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        export_path = os.path.join(upload_folder, filename)
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        with open(export_path, 'w') as f:
-            json.dump(all_settings, f, indent=2)
-        
-        return send_file(export_path, as_attachment=True, download_name=filename)
-        
+
+        return Response(
+            stream_with_context(_json_encoder.iterencode(all_settings)),
+            mimetype='application/json',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -213,15 +253,13 @@ def import_settings():
         
         # Import system settings
         if 'system' in settings_data:
-            system_file = os.path.join(config_dir, 'system.json')
-            with open(system_file, 'w') as f:
-                json.dump(settings_data['system'], f, indent=2)
-        
+            _store_json_config(os.path.join(config_dir, 'system.json'),
+                               settings_data['system'])
+
         # Import security settings (user will need to reconfigure passwords)
         if 'security' in settings_data:
-            security_file = os.path.join(config_dir, 'security.json')
-            with open(security_file, 'w') as f:
-                json.dump(settings_data['security'], f, indent=2)
+            _store_json_config(os.path.join(config_dir, 'security.json'),
+                               settings_data['security'])
         
         return jsonify({
             'success': True,
@@ -234,80 +272,141 @@ def import_settings():
 @system_api.route('/api/restart-system', methods=['POST'])
 def restart_system():
     try:
-        # First try systemctl restart for the service
+        # First try systemctl restart for the service. Popen without wait:
+        # systemd replaces this process anyway, so blocking up to 5s on the
+        # result only delays the response the client is waiting on.
         try:
-            subprocess.run(['sudo', 'systemctl', 'restart', 'dmx-control.service'], 
-                          capture_output=True, timeout=5)
+            subprocess.Popen(['sudo', 'systemctl', 'restart', 'dmx-control.service'],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             return jsonify({
                 'success': True,
-                'message': 'System service restarted'
+                'message': 'System service restarting'
             })
-        except:
+        except OSError:
             pass
-        
-        # Fallback: restart the Python application
-        import signal
-        
-        def restart_app():
-            time.sleep(1)  # Give time for response to be sent
-            os.execv(sys.executable, ['python'] + sys.argv)
-        
-        threading.Thread(target=restart_app).start()
-        
-        return jsonify({
+
+        # Fallback: re-exec the Python application. call_on_close fires once
+        # the response bytes have been flushed to the client, which replaces
+        # the old thread + 1s sleep guess with the exact handoff point.
+        resp = jsonify({
             'success': True,
             'message': 'Application restarting...'
         })
-        
+
+        @resp.call_on_close
+        def _do_exec():
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+
+        return resp
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@system_api.route('/api/factory-reset', methods=['POST'])
-def factory_reset():
+def _move_to_backup(src, dst):
+    """Move a directory into the backup location.
+
+    rename is one metadata operation when the backup sits on the same
+    filesystem (the normal case); copy+delete only happens across
+    filesystem boundaries.
+    """
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copytree(src, dst)
+        shutil.rmtree(src)
+
+# Progress of the background factory reset, read by the status endpoint
+_reset_state = {'phase': 'idle', 'error': None, 'backup_dir': None}
+_reset_lock = threading.Lock()
+
+def _set_reset_phase(**fields):
+    with _reset_lock:
+        _reset_state.update(fields)
+
+def _do_factory_reset(app_instance):
+    """Backup and wipe, run off the request thread"""
     try:
-        from flask import current_app
-        
-        data = request.get_json()
-        confirm = data.get('confirm', False)
-        
-        if not confirm:
-            return jsonify({'error': 'Factory reset requires confirmation'}), 400
-        
-        # Create backup before reset
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         backup_dir = os.path.join(os.path.expanduser('~'), 'dmx_control_backups')
         os.makedirs(backup_dir, exist_ok=True)
-        
-        # Backup database
+        _set_reset_phase(phase='backing_up_database', backup_dir=backup_dir)
+
+        # Backup database (EAFP - a missing file just means nothing to back up)
         db_path = 'dmx_control.db'  # Update with actual database path
-        if os.path.exists(db_path):
-            backup_db = os.path.join(backup_dir, f'pre_reset_db_{timestamp}.db')
+        backup_db = os.path.join(backup_dir, f'pre_reset_db_{timestamp}.db')
+        try:
             shutil.copy2(db_path, backup_db)
-        
+        except FileNotFoundError:
+            pass
+
         # Clear database
-        with current_app.app_context():
+        _set_reset_phase(phase='clearing_database')
+        with app_instance.app_context():
             db.drop_all()
             db.create_all()
-        
-        # Clear config files
+
+        # Clear config files (the backup is a rename, not a copy)
+        _set_reset_phase(phase='backing_up_config')
         config_dir = os.path.expanduser('~/.dmx_control')
-        if os.path.exists(config_dir):
-            backup_config = os.path.join(backup_dir, f'pre_reset_config_{timestamp}')
-            shutil.copytree(config_dir, backup_config)
-            shutil.rmtree(config_dir)
-        
+        backup_config = os.path.join(backup_dir, f'pre_reset_config_{timestamp}')
+        try:
+            _move_to_backup(config_dir, backup_config)
+        except FileNotFoundError:
+            pass
+
         # Clear uploads (but keep a backup)
-        upload_dir = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        if os.path.exists(upload_dir):
-            backup_uploads = os.path.join(backup_dir, f'pre_reset_uploads_{timestamp}')
-            shutil.copytree(upload_dir, backup_uploads)
-            shutil.rmtree(upload_dir)
-            os.makedirs(upload_dir, exist_ok=True)
-        
+        _set_reset_phase(phase='backing_up_uploads')
+        upload_dir = app_instance.config.get('UPLOAD_FOLDER', 'uploads')
+        backup_uploads = os.path.join(backup_dir, f'pre_reset_uploads_{timestamp}')
+        try:
+            _move_to_backup(upload_dir, backup_uploads)
+        except FileNotFoundError:
+            pass
+        os.makedirs(upload_dir, exist_ok=True)
+
+        _set_reset_phase(phase='done')
+    except Exception as e:
+        _set_reset_phase(phase='error', error=str(e))
+
+@system_api.route('/api/factory-reset', methods=['POST'])
+def factory_reset():
+    try:
+        from flask import current_app
+
+        data = request.get_json()
+        confirm = data.get('confirm', False)
+
+        if not confirm:
+            return jsonify({'error': 'Factory reset requires confirmation'}), 400
+
+        # The backup/wipe can take a while on a large uploads folder, so run
+        # it in the background instead of holding the request (and a worker
+        # slot) open; progress is polled via the status endpoint
+        with _reset_lock:
+            if _reset_state['phase'] not in ('idle', 'done', 'error'):
+                return jsonify({'success': False,
+                                'error': 'Factory reset already in progress'}), 409
+            _reset_state.update(phase='starting', error=None, backup_dir=None)
+
+        app_instance = current_app._get_current_object()
+        threading.Thread(target=_do_factory_reset, args=(app_instance,),
+                         daemon=True).start()
+
         return jsonify({
             'success': True,
-            'message': f'Factory reset completed. Backup saved to {backup_dir}'
-        })
-        
+            'message': 'Factory reset started',
+            'status_url': '/api/factory-reset/status'
+        }), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_api.route('/api/factory-reset/status')
+def factory_reset_status():
+    try:
+        with _reset_lock:
+            return jsonify({'success': True, **_reset_state})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
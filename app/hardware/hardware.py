@@ -1,5 +1,6 @@
 import threading
 import time
+import atexit
 import pygame
 import serial
 import sys
@@ -25,10 +26,15 @@ class DMXController:
     """
     def __init__(self):
         self.dmx_data = bytearray(512)  # Use bytearray for better performance
+        self.frame = bytearray(513)  # Preallocated packet: start code + universe
         self.running = False
         self.thread = None
         self.serial_port = None
         self.lock = threading.Lock()  # Thread-safe channel updates
+        # Wakes SSE stream subscribers when the universe changes; notified at
+        # most once per output frame so listeners never see more than ~44Hz
+        self.change_condition = threading.Condition()
+        self._last_pushed = None
         self._init_uart()
 
     def _init_uart(self):
@@ -84,6 +90,11 @@ class DMXController:
                 return self.dmx_data[channel - 1]
         return 0
 
+    def get_channels_snapshot(self):
+        """Copy of the whole universe as bytes, one lock acquisition"""
+        with self.lock:
+            return bytes(self.dmx_data)
+
     def set_channels(self, channel_dict):
         """Set multiple channels at once for better performance"""
         with self.lock:
@@ -91,10 +102,36 @@ class DMXController:
                 if 1 <= channel <= 512:
                     self.dmx_data[channel - 1] = max(0, min(255, int(value)))
 
+    def write_slice(self, start_channel, payload):
+        """Write a contiguous run of channel values (bytes) starting at start_channel (1-512)"""
+        if 1 <= start_channel and start_channel + len(payload) - 1 <= 512:
+            with self.lock:
+                self.dmx_data[start_channel - 1:start_channel - 1 + len(payload)] = payload
+
+    def apply_ops(self, ops):
+        """Apply a batch of compiled playback ops under one lock acquisition.
+
+        Each op is ('slice', start_channel, payload_bytes) for a contiguous
+        run or ('map', {channel: value}) for scattered channels. Batching
+        simultaneous events means one locked update per wake, so the output
+        thread picks them all up in the same frame.
+        """
+        with self.lock:
+            for op in ops:
+                if op[0] == 'slice':
+                    start = op[1] - 1
+                    payload = op[2]
+                    if 0 <= start and start + len(payload) <= 512:
+                        self.dmx_data[start:start + len(payload)] = payload
+                else:
+                    for channel, value in op[1].items():
+                        if 1 <= channel <= 512:
+                            self.dmx_data[channel - 1] = max(0, min(255, int(value)))
+
     def clear_all(self):
         """Clear all DMX channels to 0 efficiently"""
         with self.lock:
-            self.dmx_data = bytearray(512)  # Reset all to 0 instantly
+            self.dmx_data[:] = bytes(512)  # Zero in place, keep the buffer
 
     def _output_loop(self):
         """Main DMX transmission loop - runs at ~44Hz"""
@@ -108,22 +145,33 @@ class DMXController:
             except Exception as e:
                 print(f"Error in DMX output loop: {e}")
 
+            self._notify_subscribers()
+
             # Maintain consistent frame rate
             elapsed = time.time() - start_time
             sleep_time = frame_time - elapsed
             if sleep_time > 0:
                 time.sleep(sleep_time)
 
+    def _notify_subscribers(self):
+        """Wake stream listeners if the universe changed since the last frame"""
+        snapshot = self.get_channels_snapshot()
+        if snapshot != self._last_pushed:
+            self._last_pushed = snapshot
+            with self.change_condition:
+                self.change_condition.notify_all()
+
     def _send_dmx_frame(self):
         """Send a complete DMX512 frame using baudrate switching method"""
         if not self.serial_port or not self.serial_port.is_open:
             return
 
         try:
-            # Build DMX packet
+            # Snapshot the universe into the preallocated packet buffer;
+            # the lock only covers the copy, never the serial I/O below
             with self.lock:
-                packet = bytearray([0])  # Start code
-                packet.extend(self.dmx_data)  # Copy all 512 channels
+                self.frame[1:] = self.dmx_data  # Byte 0 stays the start code
+            packet = self.frame
 
             # DMX BREAK: Switch to lower baudrate and send 0x00
             # At 90000 baud, one byte (with start/stop bits) = ~111µs
@@ -221,6 +269,14 @@ class AudioPlayer:
         return False
     
     def get_position(self):
+        if self.is_playing:
+            # Prefer the mixer's own clock: it tracks what the audio device
+            # actually played, so it doesn't drift against wall-clock time
+            # under GIL stalls or scheduler load on long songs. get_pos()
+            # resets on play(), so add the seek offset back.
+            music_pos = pygame.mixer.music.get_pos()
+            if music_pos >= 0:
+                return music_pos / 1000.0 + self.seek_offset
         if self.is_playing and self.start_time:
             # Calculate actual position accounting for pauses and seeking
             elapsed = time.time() - self.start_time - self.total_pause_duration
@@ -231,12 +287,17 @@ class AudioPlayer:
             return max(0, elapsed + self.seek_offset)
         return self.seek_offset
 
+_gpio_initialized = False
+
 def setup_gpio():
-    """Initialize GPIO pins"""
-    if RPI_AVAILABLE:
+    """Initialize GPIO pins (idempotent - safe under the Flask reloader)"""
+    global _gpio_initialized
+    if RPI_AVAILABLE and not _gpio_initialized:
         GPIO.setmode(GPIO.BCM)
         # DMX now uses UART (ttyAMA0) instead of GPIO bit-banging
         # BUTTON_PIN setup moved to playback service to avoid conflicts
+        atexit.register(cleanup_gpio)  # Always release pins on exit
+        _gpio_initialized = True
 
 def cleanup_gpio():
     """Cleanup GPIO pins"""
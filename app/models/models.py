@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+import io
 import json
+import numpy as np
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -14,13 +16,25 @@ class Device(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def get_channels(self):
-        return json.loads(self.channels) if self.channels else []
+        # Memoized on the raw string - routes and playback hit the same
+        # device's channels many times per request
+        cached = getattr(self, '_channels_cache', None)
+        if cached is not None and cached[0] == self.channels:
+            return cached[1]
+        channels = json.loads(self.channels) if self.channels else []
+        self._channels_cache = (self.channels, channels)
+        return channels
 
     def set_channels(self, channels):
         self.channels = json.dumps(channels)
 
     def get_default_values(self):
-        return json.loads(self.default_values) if self.default_values else []
+        cached = getattr(self, '_default_values_cache', None)
+        if cached is not None and cached[0] == self.default_values:
+            return cached[1]
+        values = json.loads(self.default_values) if self.default_values else []
+        self._default_values_cache = (self.default_values, values)
+        return values
 
     def set_default_values(self, values):
         self.default_values = json.dumps(values)
@@ -39,9 +53,29 @@ class Song(db.Model):
     filename = db.Column(db.String(200), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     duration = db.Column(db.Float)
-    waveform_data = db.Column(db.Text)  # JSON string
+    waveform_data = db.Column(db.LargeBinary)  # np.savez_compressed bands
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    WAVEFORM_BANDS = ('amplitude', 'low', 'mid', 'high')
+
+    def get_waveform(self):
+        """Waveform bands as float32 arrays, or None if not analyzed yet"""
+        if not self.waveform_data:
+            return None
+        cached = getattr(self, '_waveform_cache', None)
+        if cached is not None and cached[0] == self.waveform_data:
+            return cached[1]
+        with np.load(io.BytesIO(self.waveform_data)) as archive:
+            waveform = {band: archive[band] for band in self.WAVEFORM_BANDS}
+        self._waveform_cache = (self.waveform_data, waveform)
+        return waveform
+
+    def set_waveform(self, waveform):
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **{band: np.asarray(waveform[band], dtype=np.float32)
+                                    for band in self.WAVEFORM_BANDS})
+        self.waveform_data = buf.getvalue()
+
 class Sequence(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=False)
@@ -51,8 +85,26 @@ class Sequence(db.Model):
     song = db.relationship('Song', backref='sequences')
     
     def get_events(self):
-        return json.loads(self.events) if self.events else []
-    
+        cached = getattr(self, '_raw_events_cache', None)
+        if cached is not None and cached[0] == self.events:
+            return cached[1]
+        events = json.loads(self.events) if self.events else []
+        self._raw_events_cache = (self.events, events)
+        return events
+
+    def get_events_sorted(self):
+        """Parsed events sorted by time, memoized until the JSON blob changes.
+
+        Replaying the same sequence (cycle/random playlist mode) skips the
+        JSON parse and sort entirely.
+        """
+        cached = getattr(self, '_events_cache', None)
+        if cached is not None and cached[0] == self.events:
+            return cached[1]
+        events = sorted(self.get_events(), key=lambda e: e.get('time', 0))
+        self._events_cache = (self.events, events)
+        return events
+
     def set_events(self, events):
         self.events = json.dumps(events)
 
@@ -62,13 +114,20 @@ class Playlist(db.Model):
     sequences = db.Column(db.Text)  # JSON array of sequence IDs
     is_active = db.Column(db.Boolean, default=True)
     random_mode = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, default=0)  # Bumped whenever sequences change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
+
     def get_sequences(self):
-        return json.loads(self.sequences) if self.sequences else []
-    
+        cached = getattr(self, '_sequences_cache', None)
+        if cached is not None and cached[0] == self.sequences:
+            return cached[1]
+        sequences = json.loads(self.sequences) if self.sequences else []
+        self._sequences_cache = (self.sequences, sequences)
+        return sequences
+
     def set_sequences(self, sequences):
         self.sequences = json.dumps(sequences)
+        self.version = (self.version or 0) + 1
 
 class Settings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
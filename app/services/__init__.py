@@ -1,2 +1,2 @@
 from . import playback
-from .audio_processing import process_audio_upload, serve_audio_preview
\ No newline at end of file
+from .audio_processing import process_audio_upload, serve_audio_preview, serve_waveform_binary
\ No newline at end of file
@@ -2,7 +2,9 @@ import os
 import json
 import numpy as np
 import librosa
-from flask import jsonify, request, send_file
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import jsonify, request, send_file, Response
 from app.models.models import Song, db
 
 # Fix for scipy compatibility
@@ -13,6 +15,17 @@ try:
 except ImportError:
     pass
 
+# Audio analysis runs in a separate process so librosa's CPU-bound work
+# (decode, STFT, beat tracking) can't hold the GIL against the DMX output
+# and playback threads. Created lazily on first upload.
+_analysis_executor = None
+
+def _get_analysis_executor():
+    global _analysis_executor
+    if _analysis_executor is None:
+        _analysis_executor = ProcessPoolExecutor(max_workers=1)
+    return _analysis_executor
+
 def process_audio_upload(app):
     """Process uploaded audio file and extract waveform data"""
     if 'file' not in request.files:
@@ -36,139 +49,152 @@ def process_audio_upload(app):
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     file.save(file_path)
     
-    # Process audio
+    # Process audio in the worker process; the request thread just blocks on
+    # the future (releasing the GIL) instead of running librosa itself
     try:
-        # Enhanced audio loading with format validation
-        y, sr = librosa.load(file_path, sr=None)  # Keep original sample rate
-        duration = librosa.get_duration(y=y, sr=sr)
-        
-        # Use original full-resolution audio data for maximum quality
-        # Convert to absolute amplitude values
-        waveform_amplitude = [float(abs(val)) for val in y.tolist()]
-        
-        # For very long files, we'll use a high resolution but not full resolution to avoid browser memory issues
-        max_points = 500000  # 500k points should handle most songs while maintaining quality
-        if len(waveform_amplitude) > max_points:
-            # Use decimation with anti-aliasing for high-quality downsampling
-            try:
-                from scipy import signal
-                decimation_factor = len(waveform_amplitude) // max_points
-                if decimation_factor > 1:
-                    # Apply anti-aliasing filter before decimation
-                    waveform_amplitude = signal.decimate(np.array(waveform_amplitude), decimation_factor, ftype='fir').tolist()
-                    waveform_amplitude = [float(val) for val in waveform_amplitude]
-            except ImportError:
-                # Simple downsampling without anti-aliasing
-                step = len(waveform_amplitude) // max_points
-                waveform_amplitude = waveform_amplitude[::step]
-        
-        # Generate frequency-based coloring data using STFT with high resolution
-        low_freq_data, mid_freq_data, high_freq_data = process_frequency_bands(y, sr, len(waveform_amplitude))
-        
-        waveform_data = {
-            'amplitude': waveform_amplitude,  # Main waveform for display
-            'low': low_freq_data,
-            'mid': mid_freq_data, 
-            'high': high_freq_data
-        }
-        
-        # BPM Analysis
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-        beat_times = [float(t) for t in librosa.frames_to_time(beats, sr=sr).tolist()]
-        
-        # Generate grid markers based on BPM
-        beats_per_bar = 4  # Standard 4/4 time
-        bar_duration = (60.0 / float(tempo)) * beats_per_bar
-        grid_markers = []
-        current_time = 0.0
-        while current_time < duration:
-            grid_markers.append({
-                'time': float(current_time),
-                'type': 'bar' if len(grid_markers) % beats_per_bar == 0 else 'beat'
-            })
-            current_time += 60.0 / float(tempo)
-        
+        global _analysis_executor
+        try:
+            analysis = _get_analysis_executor().submit(analyze_audio_file, file_path).result()
+        except (OSError, BrokenProcessPool):
+            # Worker process unavailable (e.g. fork failure) - analyze inline
+            # and let the pool be rebuilt on the next upload
+            _analysis_executor = None
+            analysis = analyze_audio_file(file_path)
+
         # Enhanced audio format info
         audio_info = {
-            'sample_rate': int(sr),
-            'channels': 1 if len(y.shape) == 1 else y.shape[0],
+            'sample_rate': analysis['sample_rate'],
+            'channels': analysis['channels'],
             'bit_depth': 32,  # librosa loads as float32
             'format': os.path.splitext(filename)[1].lower()
         }
-        
-        # Save to database
+
+        # Save to database (waveform stored as compressed float32 bands)
         song = Song(
             name=os.path.splitext(filename)[0],
             filename=filename,
             file_path=file_path,
-            duration=duration,
-            waveform_data=json.dumps(waveform_data)
+            duration=analysis['duration']
         )
+        song.set_waveform(analysis['waveform_data'])
         db.session.add(song)
         db.session.commit()
-        
+
+        # The waveform itself is served separately as binary float32 via
+        # /api/waveform/<id> - embedding it here as a JSON list costs ~15
+        # text bytes per sample against 4 binary ones
         return jsonify({
             'id': song.id,
             'name': song.name,
-            'duration': float(duration),
-            'waveform_data': waveform_data,
-            'bpm': float(tempo),
-            'beat_times': beat_times,
-            'grid_markers': grid_markers,
+            'duration': analysis['duration'],
+            'bpm': analysis['bpm'],
+            'beat_times': analysis['beat_times'],
+            'grid_markers': analysis['grid_markers'],
             'audio_info': audio_info
         })
-    
+
     except Exception as e:
         return jsonify({'error': f'Error processing audio: {str(e)}'}), 500
 
+def analyze_audio_file(file_path):
+    """Full audio analysis for an uploaded song.
+
+    Pure function of the file on disk (no Flask or DB access) so it can run
+    in the analysis worker process and be shipped back as a plain dict.
+    """
+    # Enhanced audio loading with format validation
+    y, sr = librosa.load(file_path, sr=None)  # Keep original sample rate
+    duration = librosa.get_duration(y=y, sr=sr)
+
+    # Use original full-resolution audio data for maximum quality
+    # Convert to absolute amplitude values (vectorized, stays float32 -
+    # a Python float per sample would cost ~4x the memory and 10-50x the time)
+    waveform_amplitude = np.abs(y).astype(np.float32, copy=False)
+
+    # For very long files, we'll use a high resolution but not full resolution to avoid browser memory issues
+    max_points = 500000  # 500k points should handle most songs while maintaining quality
+    if len(waveform_amplitude) > max_points:
+        # Peak-preserving downsampling: max over fixed-size blocks.
+        # A reshape plus one reduction beats FIR decimation by a wide
+        # margin and keeps transient peaks visible in the display
+        # (plain decimation attenuates them)
+        step = len(waveform_amplitude) // max_points
+        if step > 1:
+            usable = len(waveform_amplitude) // step * step
+            waveform_amplitude = waveform_amplitude[:usable].reshape(-1, step).max(axis=1)
+
+    # Generate frequency-based coloring data using STFT with high resolution
+    low_freq_data, mid_freq_data, high_freq_data = process_frequency_bands(y, sr, len(waveform_amplitude))
+
+    # Bands stay float32 ndarrays all the way to storage; a Python list
+    # copy of a 500k-point waveform costs ~14MB against ~2MB here
+    waveform_data = {
+        'amplitude': waveform_amplitude,  # Main waveform for display
+        'low': low_freq_data,
+        'mid': mid_freq_data,
+        'high': high_freq_data
+    }
+
+    # BPM Analysis (newer librosa returns tempo as a 1-element array)
+    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+    tempo = float(np.atleast_1d(tempo)[0])
+    beat_times = [float(t) for t in librosa.frames_to_time(beats, sr=sr).tolist()]
+
+    # Generate grid markers based on BPM
+    beats_per_bar = 4  # Standard 4/4 time
+    grid_markers = []
+    current_time = 0.0
+    while current_time < duration:
+        grid_markers.append({
+            'time': float(current_time),
+            'type': 'bar' if len(grid_markers) % beats_per_bar == 0 else 'beat'
+        })
+        current_time += 60.0 / float(tempo)
+
+    return {
+        'duration': float(duration),
+        'waveform_data': waveform_data,
+        'bpm': float(tempo),
+        'beat_times': beat_times,
+        'grid_markers': grid_markers,
+        'sample_rate': int(sr),
+        'channels': 1 if len(y.shape) == 1 else y.shape[0],
+    }
+
 def process_frequency_bands(y, sr, target_length):
     """Process audio into frequency bands for visualization"""
     # Use smaller chunks for high-resolution frequency analysis
     chunk_size = max(1024, sr // 20)  # At least 1024 samples, or 1/20th of a second
-    num_chunks = len(y) // chunk_size
-    
-    low_band = []
-    mid_band = []
-    high_band = []
-    
+    n_fft = chunk_size
+
     # Define frequency ranges in Hz
     low_freq_max = 250.0    # Bass: 20-250 Hz
     mid_freq_max = 4000.0   # Mids: 250-4000 Hz
     # High: 4000+ Hz
-    
-    for i in range(num_chunks):
-        start_idx = i * chunk_size
-        end_idx = min((i + 1) * chunk_size, len(y))
-        chunk = y[start_idx:end_idx]
-        
-        if len(chunk) >= 256:  # Need minimum samples for meaningful FFT
-            # Compute FFT for this chunk with appropriate window
-            window = np.hanning(len(chunk))
-            windowed_chunk = chunk * window
-            n_fft = max(1024, len(chunk))
-            fft = np.fft.rfft(windowed_chunk, n=n_fft)
-            magnitude = np.abs(fft)
-            freqs = np.fft.rfftfreq(n_fft, 1/sr)
-            
-            # Split into frequency bands
-            low_mask = freqs <= low_freq_max
-            mid_mask = (freqs > low_freq_max) & (freqs <= mid_freq_max)
-            high_mask = freqs > mid_freq_max
-            
-            # Calculate RMS energy for each band
-            low_energy = float(np.sqrt(np.mean(magnitude[low_mask]**2))) if np.any(low_mask) else 0.0
-            mid_energy = float(np.sqrt(np.mean(magnitude[mid_mask]**2))) if np.any(mid_mask) else 0.0
-            high_energy = float(np.sqrt(np.mean(magnitude[high_mask]**2))) if np.any(high_mask) else 0.0
-            
-            low_band.append(low_energy)
-            mid_band.append(mid_energy)
-            high_band.append(high_energy)
-        else:
-            # Not enough samples for FFT
-            low_band.append(0.0)
-            mid_band.append(0.0)
-            high_band.append(0.0)
-    
+
+    if len(y) >= n_fft:
+        # One batched STFT instead of a Python loop of per-chunk rfft calls;
+        # each column is the windowed spectrum of one chunk
+        magnitude = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=chunk_size,
+                                        window='hann', center=False))
+
+        # Band masks are fixed by n_fft and sr, so compute them once
+        freqs = np.fft.rfftfreq(n_fft, 1/sr)
+        low_mask = freqs <= low_freq_max
+        mid_mask = (freqs > low_freq_max) & (freqs <= mid_freq_max)
+        high_mask = freqs > mid_freq_max
+
+        # Calculate RMS energy for each band across all chunks at once
+        num_chunks = magnitude.shape[1]
+        low_band = np.sqrt(np.mean(magnitude[low_mask]**2, axis=0)) if np.any(low_mask) else np.zeros(num_chunks)
+        mid_band = np.sqrt(np.mean(magnitude[mid_mask]**2, axis=0)) if np.any(mid_mask) else np.zeros(num_chunks)
+        high_band = np.sqrt(np.mean(magnitude[high_mask]**2, axis=0)) if np.any(high_mask) else np.zeros(num_chunks)
+    else:
+        # Not enough samples for a single FFT chunk
+        return (np.zeros(target_length, dtype=np.float32),
+                np.zeros(target_length, dtype=np.float32),
+                np.zeros(target_length, dtype=np.float32))
+
     # Resample frequency data to match amplitude data length
     if len(low_band) != target_length:
         try:
@@ -180,18 +206,44 @@ def process_frequency_bands(y, sr, target_length):
             f_mid = interpolate.interp1d(x_old, mid_band, kind='linear', fill_value='extrapolate')
             f_high = interpolate.interp1d(x_old, high_band, kind='linear', fill_value='extrapolate')
             
-            low_band = [float(val) for val in f_low(x_new)]
-            mid_band = [float(val) for val in f_mid(x_new)]
-            high_band = [float(val) for val in f_high(x_new)]
+            low_band = f_low(x_new)
+            mid_band = f_mid(x_new)
+            high_band = f_high(x_new)
         except ImportError:
             # Simple linear interpolation using numpy
             ratio = target_length / len(low_band)
             new_indices = np.arange(target_length) / ratio
-            low_band = [float(np.interp(new_indices, np.arange(len(low_band)), low_band)[i]) for i in range(target_length)]
-            mid_band = [float(np.interp(new_indices, np.arange(len(mid_band)), mid_band)[i]) for i in range(target_length)]
-            high_band = [float(np.interp(new_indices, np.arange(len(high_band)), high_band)[i]) for i in range(target_length)]
-    
-    return low_band, mid_band, high_band
+            old_indices = np.arange(len(low_band))
+            low_band = np.interp(new_indices, old_indices, low_band)
+            mid_band = np.interp(new_indices, old_indices, mid_band)
+            high_band = np.interp(new_indices, old_indices, high_band)
+
+    return (np.asarray(low_band, dtype=np.float32),
+            np.asarray(mid_band, dtype=np.float32),
+            np.asarray(high_band, dtype=np.float32))
+
+def serve_waveform_binary(song_id):
+    """Serve a song's waveform as packed little-endian float32.
+
+    Layout: four uint32 lengths (amplitude, low, mid, high) followed by the
+    four arrays concatenated as float32. The browser maps the buffer
+    straight into Float32Arrays - no JSON parse and roughly a quarter of
+    the bytes on the wire.
+    """
+    try:
+        song = db.session.get(Song, song_id)
+        if not song:
+            return jsonify({'error': 'Song not found'}), 404
+
+        waveform = song.get_waveform() or {}
+        bands = [np.asarray(waveform.get(band, []), dtype='<f4')
+                 for band in Song.WAVEFORM_BANDS]
+        header = np.array([len(band) for band in bands], dtype='<u4')
+        payload = header.tobytes() + b''.join(band.tobytes() for band in bands)
+        return Response(payload, mimetype='application/octet-stream')
+
+    except Exception as e:
+        return jsonify({'error': f'Error serving waveform: {str(e)}'}), 500
 
 def serve_audio_preview(app, song_id):
     """Serve audio files for preview playback"""
@@ -223,11 +275,14 @@ def serve_audio_preview(app, song_id):
         
         content_type = content_types.get(file_ext, 'audio/mpeg')
         
+        # conditional=True enables HTTP range requests, so the browser can
+        # seek in a long preview without re-downloading the whole file
         return send_file(
             file_path,
             mimetype=content_type,
             as_attachment=False,
-            download_name=song.filename
+            download_name=song.filename,
+            conditional=True
         )
         
     except Exception as e:
@@ -1,36 +1,29 @@
 import threading
 import time
 import random
+import array
 import os
 import json
+import heapq
+import logging
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from app.models.models import Playlist, Sequence, PatchedDevice, db
 from app.hardware.hardware import RPI_AVAILABLE, setup_gpio
 
 if RPI_AVAILABLE:
     import RPi.GPIO as GPIO
 
+log = logging.getLogger(__name__)
+log.setLevel(logging.WARNING)  # Per-event DEBUG logging is opt-in via debug_mode
+
 # GPIO Configuration
 BUTTON_PIN = 18
 
-# Global variables
-current_sequence = None
-is_playing = False
-dmx_controller = None
-audio_player = None
-flask_app = None
-playback_lock = threading.Lock()
-last_trigger_time = 0
-button_locked_until = 0  # Timestamp until which the button is locked
-current_playlist_index = 0  # Track which playlist we're on
-current_sequence_index = 0  # Track which sequence in playlist
-shuffled_sequence_order = []  # Store shuffled order for random mode
-
-def init_playback(dmx_ctrl, audio_ctrl, app_instance=None):
-    """Initialize playback with controller references"""
-    global dmx_controller, audio_player, flask_app
-    dmx_controller = dmx_ctrl
-    audio_player = audio_ctrl
-    flask_app = app_instance
+def set_debug_logging(enabled):
+    """Toggle verbose per-event playback logging"""
+    log.setLevel(logging.DEBUG if enabled else logging.WARNING)
 
 def get_button_lock_settings():
     """Get button lock settings from system settings"""
@@ -38,506 +31,653 @@ def get_button_lock_settings():
         config_dir = os.path.expanduser('~/.dmx_control')
         config_file = os.path.join(config_dir, 'system.json')
 
-        if os.path.exists(config_file):
+        # EAFP: one open instead of an exists() stat plus an open
+        try:
             with open(config_file, 'r') as f:
                 settings = json.load(f)
-                return {
-                    'duration': settings.get('button_lock_duration', 0),
-                    'trigger': settings.get('button_lock_trigger', 'after_press')
-                }
-        return {'duration': 0, 'trigger': 'after_press'}
+        except FileNotFoundError:
+            return {'duration': 0, 'trigger': 'after_press'}
+        return {
+            'duration': settings.get('button_lock_duration', 0),
+            'trigger': settings.get('button_lock_trigger', 'after_press')
+        }
     except Exception as e:
-        print(f"[ERROR] Failed to read button lock settings: {e}")
+        log.error("Failed to read button lock settings: %s", e)
         return {'duration': 0, 'trigger': 'after_press'}
 
-def button_handler():
-    """Handle hardware button presses - simple edge detection with debouncing"""
-    global last_trigger_time, button_locked_until
-
-    if not RPI_AVAILABLE:
-        return
-
-    try:
-        # Setup button with pull-up resistor (button press = LOW)
-        GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        print(f"[INFO] Button handler started on GPIO {BUTTON_PIN}")
-
-        # Simple state machine
-        button_was_high = True
-
-        while True:
-            button_is_high = GPIO.input(BUTTON_PIN) == GPIO.HIGH
-            current_time = time.time()
-
-            # Detect falling edge (button pressed)
-            if button_was_high and not button_is_high:
-                # Debounce by waiting and checking again
-                time.sleep(0.05)
-
-                # Confirm button is still pressed
-                if GPIO.input(BUTTON_PIN) == GPIO.LOW:
-                    # Check if button is locked
-                    if current_time < button_locked_until:
-                        remaining_time = button_locked_until - current_time
-                        print(f"[INFO] Button is locked for {remaining_time:.1f} more seconds")
-                        # Wait for button release
-                        while GPIO.input(BUTTON_PIN) == GPIO.LOW:
-                            time.sleep(0.05)
-                        button_was_high = True
-                        time.sleep(0.1)
-                        continue
-
-                    # Check if a sequence is currently playing (when using after_sequence trigger)
-                    lock_settings = get_button_lock_settings()
-                    if is_playing and lock_settings['trigger'] == 'after_sequence':
-                        print(f"[INFO] Button press ignored - sequence is playing (after_sequence mode)")
-                        # Wait for button release
-                        while GPIO.input(BUTTON_PIN) == GPIO.LOW:
-                            time.sleep(0.05)
-                        button_was_high = True
-                        time.sleep(0.1)
-                        continue
-
-                    # Check cooldown period
-                    if current_time - last_trigger_time >= 2.0:
-                        print(f"[INFO] Button pressed - triggering playback")
-                        last_trigger_time = current_time
-
-                        # Apply button lock if configured to trigger after press
-                        if lock_settings['duration'] > 0 and lock_settings['trigger'] == 'after_press':
-                            button_locked_until = current_time + lock_settings['duration']
-                            print(f"[INFO] Button locked for {lock_settings['duration']} seconds after button press")
-
-                        # Trigger playback in background to avoid blocking
-                        threading.Thread(target=trigger_sequence_playback, daemon=True).start()
-
-                        # Wait for button release to prevent repeat triggers
-                        while GPIO.input(BUTTON_PIN) == GPIO.LOW:
-                            time.sleep(0.05)
-
-                        print(f"[INFO] Button released")
-                        button_was_high = True
-                        time.sleep(0.1)  # Extra debounce after release
-                        continue
-
-            button_was_high = button_is_high
-            time.sleep(0.02)
-
-    except Exception as e:
-        print(f"[ERROR] Button handler error: {e}")
-        import traceback
-        traceback.print_exc()
-        return
-
-def trigger_sequence_playback():
-    """Trigger playback from hardware button - must acquire lock to execute"""
-    global current_sequence, is_playing, flask_app, current_playlist_index, current_sequence_index, shuffled_sequence_order
-
-    # Try to acquire lock - if already locked, exit immediately
-    lock_acquired = playback_lock.acquire(blocking=False)
-    if not lock_acquired:
-        print("[WARNING] Trigger ignored - playback already starting")
-        return
+def compile_events(events, device_cache):
+    """Pre-compile events into sorted (time, end_time, writes, clears) tuples.
+
+    writes and clears are fully resolved at compile time - hex colors
+    parsed, dimmer percentages scaled, channel offsets applied. Each op is
+    either ('slice', start_address, payload_bytes) for a contiguous channel
+    run (one locked memcpy at playback time) or ('map', {address: value})
+    for scattered channels, handed to dmx_controller.set_channels().
+    Events that resolve to no channels are dropped entirely.
+    """
+    compiled = []
+
+    for event in events:
+        try:
+            cached = device_cache.get(event.get('device_id'))
+            if not cached:
+                log.warning("No patched device found for ID %s", event.get('device_id'))
+                continue
+
+            start_address, channels, offsets = cached
+            event_type = event.get('type')
+            value = event.get('value', 0)
+            writes = []
+
+            if event_type == 'dimmer':
+                dmx_value = int(value * 255 / 100)
+                for offset in offsets.get('dimmer_channel', ()):
+                    writes.append((start_address + offset, dmx_value))
+            elif event_type == 'color':
+                # Handle both hex string and RGB dict formats
+                color_value = event.get('color')
+                if isinstance(color_value, str):
+                    hex_color = color_value.lstrip('#')
+                    color = {
+                        'r': int(hex_color[0:2], 16),
+                        'g': int(hex_color[2:4], 16),
+                        'b': int(hex_color[4:6], 16)
+                    }
+                else:
+                    color = color_value or {}
 
-    try:
-        print("[INFO] Lock acquired - starting playback trigger")
+                for channel_type, color_key in (('red_channel', 'r'), ('green_channel', 'g'),
+                                                ('blue_channel', 'b'), ('white_channel', 'w')):
+                    for offset in offsets.get(channel_type, ()):
+                        writes.append((start_address + offset, color.get(color_key, 0)))
+            elif event_type == 'position':
+                for channel_type in ('pan', 'tilt'):
+                    for offset in offsets.get(channel_type, ()):
+                        writes.append((start_address + offset, value.get(channel_type, 0)))
+
+            if not writes:
+                continue
+
+            event_time = event.get('time', 0)
+            event_end_time = event_time + event.get('duration', 2.0)  # Default 2 seconds
+            writes = dict(writes)
+            addresses = sorted(writes)
+            if len(addresses) > 1 and addresses[-1] - addresses[0] == len(addresses) - 1:
+                # Contiguous run (e.g. an RGBW block): pre-bake a bytes payload so
+                # execution is a single slice copy instead of per-channel writes
+                payload = bytes(max(0, min(255, int(writes[a]))) for a in addresses)
+                write_op = ('slice', addresses[0], payload)
+                clear_op = ('slice', addresses[0], bytes(len(addresses)))
+            else:
+                write_op = ('map', writes)
+                clear_op = ('map', {address: 0 for address in writes})
+            compiled.append((event_time, event_end_time, write_op, clear_op))
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+            # Malformed events are rejected here, at compile time, instead of
+            # blowing up (or being silently swallowed) mid-playback
+            log.warning("Skipping malformed event %r: %s", event, e)
+
+    compiled.sort(key=lambda c: c[0])
+    return compiled
+
+class PlaybackEngine:
+    """Drives sequence playback and owns all playback state.
+
+    All mutable playback state lives on the instance instead of module
+    globals, so hot-loop reads are plain attribute lookups and a separate
+    engine can be constructed in isolation. The module keeps a singleton
+    (`engine`) plus wrapper functions so existing callers are unaffected.
+    """
+
+    def __init__(self):
+        # Guards the is_playing/current_sequence pair. API endpoints run on
+        # Flask's worker threads concurrently with the playback loop and the
+        # button handler, so state transitions must be atomic; hold times are
+        # kept to the flag flips themselves (never audio or DMX I/O)
+        self.state_lock = threading.RLock()
+        self.current_sequence = None
+        self.is_playing = False
+        self.dmx_controller = None
+        self.audio_player = None
+        self.flask_app = None
+        # Busy gate, not a critical-section mutex: a trigger only needs to
+        # know whether another trigger is already in flight
+        self.trigger_gate = threading.Semaphore(1)
+        self.stop_event = threading.Event()  # Wakes the playback loop early on stop
+        self.last_trigger_time = 0
+        self.button_locked_until = 0  # Timestamp until which the button is locked
+        self.current_playlist_index = 0  # Track which playlist we're on
+        self.current_sequence_index = 0  # Track which sequence in playlist
+        self.shuffled_sequence_order = array.array('i')  # Shuffled order for random mode
+        self.shuffled_state = (None, None)  # (playlist id, version) the order was built from
+        # Persistent pool instead of a fresh thread per button press / playback:
+        # one worker for triggers, one for the current playback loop
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='playback')
+        self._playback_future = None
+
+    def init(self, dmx_ctrl, audio_ctrl, app_instance=None):
+        """Initialize playback with controller references"""
+        self.dmx_controller = dmx_ctrl
+        self.audio_player = audio_ctrl
+        self.flask_app = app_instance
+
+        # Honor the debug_mode system setting for verbose playback logging
+        try:
+            config_file = os.path.join(os.path.expanduser('~/.dmx_control'), 'system.json')
+            with open(config_file, 'r') as f:
+                set_debug_logging(json.load(f).get('debug_mode', False))
+        except Exception:
+            pass
+
+    def _wait_for_button_release(self):
+        """Block in the kernel until the button's rising edge (release) arrives.
+
+        wait_for_edge sleeps on poll() instead of burning a Python wakeup
+        every 50ms; the timeout guards against a stuck or held button.
+        """
+        while GPIO.input(BUTTON_PIN) == GPIO.LOW:
+            GPIO.wait_for_edge(BUTTON_PIN, GPIO.RISING, timeout=5000)
+
+    def button_handler(self):
+        """Handle hardware button presses - simple edge detection with debouncing"""
+        if not RPI_AVAILABLE:
+            return
 
-        if not flask_app:
-            print("[ERROR] Flask app not initialized")
+        try:
+            # Clear any stale registration left from a previous run (e.g. the
+            # Flask reloader restarting us) before re-registering the pin
+            try:
+                GPIO.remove_event_detect(BUTTON_PIN)
+            except Exception:
+                pass
+            try:
+                GPIO.cleanup(BUTTON_PIN)
+            except Exception:
+                pass
+
+            # Setup button with pull-up resistor (button press = LOW)
+            GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            log.info("Button handler started on GPIO %d", BUTTON_PIN)
+
+            # Simple state machine
+            button_was_high = True
+
+            while True:
+                button_is_high = GPIO.input(BUTTON_PIN) == GPIO.HIGH
+                current_time = time.monotonic()
+
+                # Detect falling edge (button pressed)
+                if button_was_high and not button_is_high:
+                    # Debounce by waiting and checking again
+                    time.sleep(0.05)
+
+                    # Confirm button is still pressed
+                    if GPIO.input(BUTTON_PIN) == GPIO.LOW:
+                        # Check if button is locked
+                        if current_time < self.button_locked_until:
+                            remaining_time = self.button_locked_until - current_time
+                            log.info("Button is locked for %.1f more seconds", remaining_time)
+                            # Wait for button release
+                            self._wait_for_button_release()
+                            button_was_high = True
+                            time.sleep(0.1)
+                            continue
+
+                        # Check if a sequence is currently playing (when using after_sequence trigger)
+                        lock_settings = get_button_lock_settings()
+                        if self.is_playing and lock_settings['trigger'] == 'after_sequence':
+                            log.info("Button press ignored - sequence is playing (after_sequence mode)")
+                            # Wait for button release
+                            self._wait_for_button_release()
+                            button_was_high = True
+                            time.sleep(0.1)
+                            continue
+
+                        # Check cooldown period
+                        if current_time - self.last_trigger_time >= 2.0:
+                            log.info("Button pressed - triggering playback")
+                            self.last_trigger_time = current_time
+
+                            # Apply button lock if configured to trigger after press
+                            if lock_settings['duration'] > 0 and lock_settings['trigger'] == 'after_press':
+                                self.button_locked_until = current_time + lock_settings['duration']
+                                log.info("Button locked for %s seconds after button press", lock_settings['duration'])
+
+                            # Trigger playback in background to avoid blocking
+                            self._executor.submit(self.trigger_sequence_playback)
+
+                            # Wait for button release to prevent repeat triggers
+                            self._wait_for_button_release()
+
+                            log.info("Button released")
+                            button_was_high = True
+                            time.sleep(0.1)  # Extra debounce after release
+                            continue
+
+                button_was_high = button_is_high
+                time.sleep(0.02)
+
+        except Exception:
+            log.exception("Button handler error")
             return
 
-        with flask_app.app_context():
-            # Get active playlists
-            active_playlists = Playlist.query.filter_by(is_active=True).all()
-            if not active_playlists:
-                print("[WARNING] No active playlists found")
-                return
+    def trigger_sequence_playback(self):
+        """Trigger playback from hardware button - must acquire lock to execute"""
+        # Non-blocking busy check - if another trigger is in flight, exit immediately
+        if not self.trigger_gate.acquire(blocking=False):
+            log.warning("Trigger ignored - playback already starting")
+            return
 
-            # Ensure playlist index is valid
-            if current_playlist_index >= len(active_playlists):
-                current_playlist_index = 0
-
-            # Get current playlist
-            playlist = active_playlists[current_playlist_index]
-            sequence_ids = playlist.get_sequences()
-            if not sequence_ids:
-                print("[WARNING] Playlist has no sequences")
-                # Move to next playlist
-                current_playlist_index = (current_playlist_index + 1) % len(active_playlists)
-                current_sequence_index = 0
-                shuffled_sequence_order = []
-                return
+        try:
+            log.info("Starting playback trigger")
 
-            # Select sequence based on random mode
-            if playlist.random_mode:
-                # Random mode: shuffle once, then play in that order
-                # Check if we need to create a new shuffle (playlist changed or finished)
-                if (not shuffled_sequence_order or
-                    set(shuffled_sequence_order) != set(sequence_ids) or
-                    current_sequence_index >= len(shuffled_sequence_order)):
-                    shuffled_sequence_order = sequence_ids.copy()
-                    random.shuffle(shuffled_sequence_order)
-                    current_sequence_index = 0
-                    print(f"[INFO] Random mode: shuffled playlist")
-
-                sequence_id = shuffled_sequence_order[current_sequence_index]
-                print(f"[INFO] Random mode: playing {current_sequence_index + 1}/{len(shuffled_sequence_order)} from shuffled order")
-
-                # Move to next in shuffled order
-                current_sequence_index += 1
-                if current_sequence_index >= len(shuffled_sequence_order):
-                    # Finished shuffled playlist, move to next playlist and reshuffle
-                    current_sequence_index = 0
-                    current_playlist_index = (current_playlist_index + 1) % len(active_playlists)
-                    shuffled_sequence_order = []
-            else:
-                # Cycle mode: pick next sequence in order
-                if current_sequence_index >= len(sequence_ids):
-                    current_sequence_index = 0
-                sequence_id = sequence_ids[current_sequence_index]
-                print(f"[INFO] Cycle mode: selecting sequence {current_sequence_index + 1}/{len(sequence_ids)}")
-
-                # Move to next sequence for next button press
-                current_sequence_index += 1
-                if current_sequence_index >= len(sequence_ids):
-                    # Finished playlist, move to next one
-                    current_sequence_index = 0
-                    current_playlist_index = (current_playlist_index + 1) % len(active_playlists)
-
-            sequence = db.session.get(Sequence, sequence_id)
-            if not sequence or not sequence.song:
-                print("[WARNING] Sequence or song not found")
+            if not self.flask_app:
+                log.error("Flask app not initialized")
                 return
 
-            print(f"[INFO] Playing sequence: {sequence.name if hasattr(sequence, 'name') else 'Unnamed'}")
-            play_sequence(sequence)
-
-            # Hold lock briefly to ensure playback fully initializes
-            time.sleep(0.5)
-            print("[INFO] Playback started successfully")
-
-    except Exception as e:
-        print(f"[ERROR] Playback trigger failed: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        playback_lock.release()
-        print("[INFO] Lock released")
+            with self.flask_app.app_context():
+                # Get active playlists
+                active_playlists = Playlist.query.filter_by(is_active=True).all()
+                if not active_playlists:
+                    log.warning("No active playlists found")
+                    return
+
+                # Ensure playlist index is valid
+                if self.current_playlist_index >= len(active_playlists):
+                    self.current_playlist_index = 0
+
+                # Get current playlist
+                playlist = active_playlists[self.current_playlist_index]
+                sequence_ids = playlist.get_sequences()
+                if not sequence_ids:
+                    log.warning("Playlist has no sequences")
+                    # Move to next playlist
+                    self.current_playlist_index = (self.current_playlist_index + 1) % len(active_playlists)
+                    self.current_sequence_index = 0
+                    self.shuffled_sequence_order = array.array('i')
+                    self.shuffled_state = (None, None)
+                    return
+
+                # Select sequence based on random mode
+                if playlist.random_mode:
+                    # Random mode: shuffle once, then play in that order.
+                    # The (id, version) pair detects playlist changes without
+                    # rebuilding sets of sequence IDs on every press
+                    playlist_state = (playlist.id, playlist.version)
+                    if (self.shuffled_state != playlist_state or
+                        self.current_sequence_index >= len(self.shuffled_sequence_order)):
+                        # Compact int buffer shuffled in place - no list copy
+                        self.shuffled_sequence_order = array.array('i', sequence_ids)
+                        random.shuffle(self.shuffled_sequence_order)
+                        self.shuffled_state = playlist_state
+                        self.current_sequence_index = 0
+                        log.info("Random mode: shuffled playlist")
+
+                    sequence_id = self.shuffled_sequence_order[self.current_sequence_index]
+                    log.info("Random mode: playing %d/%d from shuffled order",
+                             self.current_sequence_index + 1, len(self.shuffled_sequence_order))
+
+                    # Move to next in shuffled order
+                    self.current_sequence_index += 1
+                    if self.current_sequence_index >= len(self.shuffled_sequence_order):
+                        # Finished shuffled playlist, move to next playlist and reshuffle
+                        self.current_sequence_index = 0
+                        self.current_playlist_index = (self.current_playlist_index + 1) % len(active_playlists)
+                        self.shuffled_sequence_order = array.array('i')
+                        self.shuffled_state = (None, None)
+                else:
+                    # Cycle mode: pick next sequence in order
+                    if self.current_sequence_index >= len(sequence_ids):
+                        self.current_sequence_index = 0
+                    sequence_id = sequence_ids[self.current_sequence_index]
+                    log.info("Cycle mode: selecting sequence %d/%d",
+                             self.current_sequence_index + 1, len(sequence_ids))
+
+                    # Move to next sequence for next button press
+                    self.current_sequence_index += 1
+                    if self.current_sequence_index >= len(sequence_ids):
+                        # Finished playlist, move to next one
+                        self.current_sequence_index = 0
+                        self.current_playlist_index = (self.current_playlist_index + 1) % len(active_playlists)
+
+                sequence = db.session.get(Sequence, sequence_id)
+                if not sequence or not sequence.song:
+                    log.warning("Sequence or song not found")
+                    return
+
+                log.info("Playing sequence: %s", sequence.name if hasattr(sequence, 'name') else 'Unnamed')
+                self.play_sequence(sequence)
+                log.info("Playback started successfully")
+
+        except Exception:
+            log.exception("Playback trigger failed")
+        finally:
+            self.trigger_gate.release()
+            log.info("Trigger finished")
+
+    def play_sequence(self, sequence, start_time=0):
+        """Play a lighting sequence"""
+        log.info("play_sequence called for: %s", sequence.song.file_path if sequence.song else 'No song')
+
+        # Stop any existing playback completely
+        with self.state_lock:
+            was_playing = self.is_playing
+        if was_playing:
+            log.info("Stopping existing playback")
+            self.stop_playback()
+
+        with self.state_lock:
+            self.current_sequence = sequence
+            self.is_playing = True
+            self.stop_event.clear()
+
+        # Clear all DMX channels to 0 at the start of the sequence
+        if self.dmx_controller:
+            log.info("Clearing all DMX channels to 0 before starting sequence")
+            self.dmx_controller.clear_all()
+            time.sleep(0.05)  # Brief delay to ensure clear is applied
 
-def play_sequence(sequence, start_time=0):
-    """Play a lighting sequence"""
-    global current_sequence, is_playing
-
-    print(f"[INFO] play_sequence called for: {sequence.song.file_path if sequence.song else 'No song'}")
-
-    # Stop any existing playback completely
-    if is_playing:
-        print("[INFO] Stopping existing playback")
-        stop_playback()
-
-    current_sequence = sequence
-    is_playing = True
-
-    # Clear all DMX channels to 0 at the start of the sequence
-    if dmx_controller:
-        print("[INFO] Clearing all DMX channels to 0 before starting sequence")
-        dmx_controller.clear_all()
-        time.sleep(0.05)  # Brief delay to ensure clear is applied
-
-    # Load and play audio
-    if audio_player.load_song(sequence.song.file_path):
-        print("[INFO] Audio loaded, starting playback")
-        audio_player.play(start_time)
-
-        # Start sequence playback in separate thread
-        playback_thread = threading.Thread(target=sequence_playback_loop, args=(sequence, start_time))
-        playback_thread.daemon = True
-        playback_thread.start()
-        print("[INFO] Playback thread started")
-    else:
-        print("[ERROR] Failed to load audio file")
-
-def sequence_playback_loop(sequence, start_time_offset=0):
-    """Main loop for sequence playback"""
-    global is_playing, current_sequence
-
-    events = sequence.get_events()
-    events.sort(key=lambda x: x.get('time', 0))
-
-    # Get song duration
-    song_duration = sequence.song.duration if sequence.song else 0
-    print(f"[PLAYBACK] Starting sequence loop with {len(events)} events, song duration: {song_duration}s")
-
-    start_time = time.time()
-    event_index = 0
-    active_events = []  # Track events that need to be cleared at end_time
-
-    # Skip events that are before the start time offset
-    while event_index < len(events) and events[event_index].get('time', 0) < start_time_offset:
-        event_index += 1
-
-    print(f"[PLAYBACK] Starting from event index {event_index}")
-
-    # Continue loop until song finishes (not just until last event)
-    while is_playing:
-        current_time = time.time() - start_time + start_time_offset
-
-        # Check if song has finished
-        if current_time >= song_duration:
-            print(f"[PLAYBACK] Song finished at {current_time:.2f}s (duration: {song_duration}s)")
-            break
-
-        # Execute new events
-        while event_index < len(events):
-            event = events[event_index]
-            if current_time >= event.get('time', 0):
-                print(f"[PLAYBACK] Executing event {event_index}: {event}")
-                execute_dmx_event(event)
-
-                # Track all events for cleanup at end_time
-                active_events.append(event)
-                event_index += 1
-            else:
+        # Load and play audio
+        if self.audio_player.load_song(sequence.song.file_path):
+            log.info("Audio loaded, starting playback")
+            self.audio_player.play(start_time)
+
+            # Run the sequence loop on the persistent pool
+            self._playback_future = self._executor.submit(self.sequence_playback_loop, sequence, start_time)
+            log.info("Playback thread started")
+        else:
+            log.error("Failed to load audio file")
+
+    def build_device_cache(self, events):
+        """Resolve all patched devices referenced by events into a plain dict.
+
+        Returns {patched_device_id: (start_address, channels, offsets)} where
+        offsets maps channel type (e.g. 'red_channel') to the list of indices
+        with that type in the device's channel list (a dimmer pack repeats
+        'dimmer_channel'). Resolving once per playback avoids a DB round-trip
+        and JSON parse per event inside the 10ms playback loop.
+        """
+        device_cache = {}
+        device_ids = {e.get('device_id') for e in events if e.get('device_id') is not None}
+
+        if not device_ids or not self.flask_app:
+            return device_cache
+
+        with self.flask_app.app_context():
+            patched_devices = PatchedDevice.query.filter(PatchedDevice.id.in_(device_ids)).all()
+            for patched_device in patched_devices:
+                channels = patched_device.device.get_channels()
+                offsets = {}
+                for i, channel in enumerate(channels):
+                    channel_type = channel.get('type')
+                    if channel_type:
+                        offsets.setdefault(channel_type, []).append(i)
+                device_cache[patched_device.id] = (patched_device.start_address, channels, offsets)
+
+        return device_cache
+
+    def sequence_playback_loop(self, sequence, start_time_offset=0):
+        """Main loop for sequence playback"""
+        # Hold a single app context for the entire playback so lazy ORM loads
+        # (sequence.song, the device cache) don't push/pop a context per access
+        if self.flask_app:
+            with self.flask_app.app_context():
+                self._playback_loop(sequence, start_time_offset)
+        else:
+            self._playback_loop(sequence, start_time_offset)
+
+    def _playback_loop(self, sequence, start_time_offset=0):
+        # Memoized on the model, so replaying a sequence skips the JSON parse
+        # (temporary sequences from the editor only provide get_events)
+        get_events = getattr(sequence, 'get_events_sorted', sequence.get_events)
+        events = get_events()
+
+        # Resolve all device lookups once and pre-compile the events so the loop
+        # never touches the DB or re-parses event dicts
+        device_cache = self.build_device_cache(events)
+        compiled_events = compile_events(events, device_cache)
+
+        # Event start times as a flat array so due events are found with a
+        # binary search instead of a Python scan
+        event_times = np.array([c[0] for c in compiled_events], dtype=np.float64)
+
+        # Get song duration
+        song_duration = sequence.song.duration if sequence.song else 0
+        log.info("Starting sequence loop with %d events, song duration: %ss", len(compiled_events), song_duration)
+
+        # Bind hot-loop lookups to locals
+        dmx_controller = self.dmx_controller
+        stop_event = self.stop_event
+
+        start_time = time.monotonic()
+
+        # If events expire in the same order they start (the common
+        # non-overlapping cue list), a deque gives O(1) FIFO expiration;
+        # otherwise fall back to a min-heap keyed by end_time
+        monotone_end = all(compiled_events[i][1] <= compiled_events[i + 1][1]
+                           for i in range(len(compiled_events) - 1))
+        active_events = deque() if monotone_end else []
+        active_seq = 0  # Tie-breaker so the heap never compares write lists
+
+        # Skip events that are before the start time offset
+        event_index = int(np.searchsorted(event_times, start_time_offset, side='left'))
+
+        log.debug("Starting from event index %d", event_index)
+
+        # Continue loop until song finishes (not just until last event);
+        # the stop event is observed both here and mid-sleep below
+        while self.is_playing and not stop_event.is_set():
+            current_time = time.monotonic() - start_time + start_time_offset
+
+            # Check if song has finished
+            if current_time >= song_duration:
+                log.debug("Song finished at %.2fs (duration: %ss)", current_time, song_duration)
                 break
 
-        # Check for events that need to be cleared
-        events_to_remove = []
-        for active_event in active_events:
-            # Calculate end_time from start time + duration
-            event_start_time = active_event.get('time', 0)
-            event_duration = active_event.get('duration', 2.0)  # Default 2 seconds
-            event_end_time = event_start_time + event_duration
-
-            if current_time >= event_end_time:
-                print(f"[PLAYBACK] Event ended at {event_end_time:.2f}s (duration: {event_duration}s) - clearing DMX")
-                clear_dmx_event(active_event)
-                events_to_remove.append(active_event)
-
-        # Remove cleared events from active list
-        for event in events_to_remove:
-            active_events.remove(event)
-
-        time.sleep(0.01)  # 10ms precision
+            # Execute all events that have become due (binary search for the
+            # cutoff index, then apply that whole slice as one batch so
+            # simultaneous events land in the same locked update/frame)
+            due_index = int(np.searchsorted(event_times, current_time, side='right'))
+            if due_index > event_index:
+                due_ops = []
+                for i in range(event_index, due_index):
+                    event_time, event_end_time, write_op, clear_op = compiled_events[i]
+                    log.debug("Executing event %d at %.2fs", i, event_time)
+                    due_ops.append(write_op)
+
+                    # Track the clears for cleanup at end_time
+                    if monotone_end:
+                        active_events.append((event_end_time, clear_op))
+                    else:
+                        heapq.heappush(active_events, (event_end_time, active_seq, clear_op))
+                        active_seq += 1
+                dmx_controller.apply_ops(due_ops)
+                event_index = due_index
+
+            # Clear events whose end_time has passed (soonest first),
+            # batched the same way as the writes
+            clear_ops = []
+            while active_events and active_events[0][0] <= current_time:
+                if monotone_end:
+                    event_end_time, clear_op = active_events.popleft()
+                else:
+                    event_end_time, _, clear_op = heapq.heappop(active_events)
+                log.debug("Event ended at %.2fs - clearing DMX", event_end_time)
+                clear_ops.append(clear_op)
+            if clear_ops:
+                dmx_controller.apply_ops(clear_ops)
+
+            # Sleep until the next event or expiration is due instead of polling
+            # every 10ms; cap the wait so stop/finish is still noticed promptly
+            next_event_time = compiled_events[event_index][0] if event_index < len(compiled_events) else float('inf')
+            next_clear_time = active_events[0][0] if active_events else float('inf')
+            wait = min(next_event_time, next_clear_time) - (time.monotonic() - start_time + start_time_offset)
+            stop_event.wait(min(max(wait, 0), 0.05))
+
+        log.debug("Sequence loop finished")
+
+        # Cleanup when sequence finishes naturally (not stopped by user).
+        # The check-and-clear is atomic so a concurrent stop_playback can't
+        # interleave and double-run the cleanup below
+        with self.state_lock:
+            finished_naturally = self.is_playing
+            if finished_naturally:
+                self.is_playing = False
+                self.current_sequence = None
+
+        if finished_naturally:
+            log.info("Sequence completed - cleaning up and applying default values")
+
+            # Clear all DMX channels first
+            if self.dmx_controller:
+                self.dmx_controller.clear_all()
+                time.sleep(0.05)  # Brief delay to ensure clear is applied
+                # Apply default values
+                self.apply_default_values()
+
+            # Stop audio player
+            if self.audio_player:
+                self.audio_player.stop()
+
+            # Apply button lock after sequence completion if configured
+            lock_settings = get_button_lock_settings()
+            if lock_settings['duration'] > 0 and lock_settings['trigger'] == 'after_sequence':
+                self.button_locked_until = time.monotonic() + lock_settings['duration']
+                log.info("Button locked for %s seconds after sequence completion", lock_settings['duration'])
+
+    def apply_default_values(self):
+        """Apply default DMX values to all patched devices when no sequence is playing"""
+        if not self.flask_app or not self.dmx_controller:
+            return
 
-    print(f"[PLAYBACK] Sequence loop finished")
+        # CRITICAL: Only apply defaults when NO sequence is playing
+        if self.is_playing:
+            log.debug("Skipping default values - sequence is playing")
+            return
 
-    # Cleanup when sequence finishes naturally (not stopped by user)
-    if is_playing:
-        print("[PLAYBACK] Sequence completed - cleaning up and applying default values")
-        is_playing = False
-        current_sequence = None
+        log.debug("Applying default values to patched devices")
+
+        with self.flask_app.app_context():
+            patched_devices = PatchedDevice.query.all()
+            for patch in patched_devices:
+                device = patch.device
+                channels = device.get_channels()
+                default_values = device.get_default_values()
+
+                # Apply default values for each channel
+                for i, channel in enumerate(channels):
+                    dmx_address = patch.start_address + i
+                    # Use default value if available, otherwise use 0
+                    default_value = default_values[i] if i < len(default_values) else 0
+                    self.dmx_controller.set_channel(dmx_address, default_value)
+                    log.debug("Setting default CH%d = %s", dmx_address, default_value)
+
+    def stop_playback(self):
+        """Stop current playback and restore default values"""
+        log.info("Stopping playback")
+        with self.state_lock:
+            self.is_playing = False
+            self.current_sequence = None
+            self.stop_event.set()  # Wake the playback loop so it exits immediately
+
+        # Join the previous loop so a restart can't race its cleanup
+        future = self._playback_future
+        if future is not None:
+            try:
+                future.result(timeout=1.0)
+            except Exception:
+                log.warning("Playback loop did not exit cleanly")
+            self._playback_future = None
+
+        if self.audio_player:
+            self.audio_player.stop()
+            time.sleep(0.1)
 
         # Clear all DMX channels first
-        if dmx_controller:
-            dmx_controller.clear_all()
+        if self.dmx_controller:
+            self.dmx_controller.clear_all()
             time.sleep(0.05)  # Brief delay to ensure clear is applied
             # Apply default values
-            apply_default_values()
-
-        # Stop audio player
-        if audio_player:
-            audio_player.stop()
-
-        # Apply button lock after sequence completion if configured
-        lock_settings = get_button_lock_settings()
-        if lock_settings['duration'] > 0 and lock_settings['trigger'] == 'after_sequence':
-            global button_locked_until
-            button_locked_until = time.time() + lock_settings['duration']
-            print(f"[PLAYBACK] Button locked for {lock_settings['duration']} seconds after sequence completion")
-
-def execute_dmx_event(event):
-    """Execute a single DMX event"""
-    global flask_app
-
-    patched_device_id = event.get('device_id')
-    event_type = event.get('type')
-    value = event.get('value', 0)
-
-    print(f"[DMX] Executing event - patched_device_id: {patched_device_id}, type: {event_type}, value: {value}")
-
-    if not flask_app:
-        print("[DMX] ERROR: No flask_app")
-        return
-
-    with flask_app.app_context():
-        # Query by patched device ID (not device template ID)
-        patched_device = db.session.get(PatchedDevice, patched_device_id)
-        if not patched_device:
-            print(f"[DMX] ERROR: No patched device found for ID {patched_device_id}")
-            return
-
-        device = patched_device.device
-        channels = device.get_channels()
-
-        print(f"[DMX] Found device: {device.name}, start_address: {patched_device.start_address}, channels: {len(channels)}")
-
-        for i, channel in enumerate(channels):
-            dmx_address = patched_device.start_address + i
-            channel_type = channel.get('type')
-
-            if event_type == 'dimmer' and channel_type == 'dimmer_channel':
-                dmx_value = int(value * 255 / 100)
-                print(f"[DMX] Setting dimmer CH{dmx_address} = {dmx_value}")
-                dmx_controller.set_channel(dmx_address, dmx_value)
-            elif event_type == 'color':
-                # Handle both hex string and RGB dict formats
-                color_value = event.get('color')
-                if isinstance(color_value, str):
-                    # Convert hex to RGB
-                    hex_color = color_value.lstrip('#')
-                    r = int(hex_color[0:2], 16)
-                    g = int(hex_color[2:4], 16)
-                    b = int(hex_color[4:6], 16)
-                    color = {'r': r, 'g': g, 'b': b}
-                    print(f"[DMX] Converted hex {color_value} to RGB: r={r}, g={g}, b={b}")
-                else:
-                    color = color_value or {}
+            self.apply_default_values()
 
-                if channel_type == 'red_channel':
-                    print(f"[DMX] Setting red CH{dmx_address} = {color.get('r', 0)}")
-                    dmx_controller.set_channel(dmx_address, color.get('r', 0))
-                elif channel_type == 'green_channel':
-                    print(f"[DMX] Setting green CH{dmx_address} = {color.get('g', 0)}")
-                    dmx_controller.set_channel(dmx_address, color.get('g', 0))
-                elif channel_type == 'blue_channel':
-                    print(f"[DMX] Setting blue CH{dmx_address} = {color.get('b', 0)}")
-                    dmx_controller.set_channel(dmx_address, color.get('b', 0))
-                elif channel_type == 'white_channel':
-                    print(f"[DMX] Setting white CH{dmx_address} = {color.get('w', 0)}")
-                    dmx_controller.set_channel(dmx_address, color.get('w', 0))
-            elif event_type == 'position':
-                if channel_type == 'pan':
-                    print(f"[DMX] Setting pan CH{dmx_address} = {value.get('pan', 0)}")
-                    dmx_controller.set_channel(dmx_address, value.get('pan', 0))
-                elif channel_type == 'tilt':
-                    print(f"[DMX] Setting tilt CH{dmx_address} = {value.get('tilt', 0)}")
-                    dmx_controller.set_channel(dmx_address, value.get('tilt', 0))
-
-def clear_dmx_event(event):
-    """Clear DMX channels for an event (set to 0)"""
-    global flask_app
-
-    patched_device_id = event.get('device_id')
-    event_type = event.get('type')
-
-    print(f"[DMX] Clearing event - patched_device_id: {patched_device_id}, type: {event_type}")
-
-    if not flask_app:
-        print("[DMX] ERROR: No flask_app")
-        return
-
-    with flask_app.app_context():
-        # Query by patched device ID (not device template ID)
-        patched_device = db.session.get(PatchedDevice, patched_device_id)
-        if not patched_device:
-            print(f"[DMX] ERROR: No patched device found for ID {patched_device_id}")
-            return
+    def pause_playback(self):
+        """Pause current playback"""
+        with self.state_lock:
+            if not self.is_playing:
+                return
+            self.is_playing = False
+        if self.audio_player:
+            self.audio_player.pause()
+
+    def resume_playback(self):
+        """Resume paused playback"""
+        with self.state_lock:
+            if self.is_playing or not self.current_sequence:
+                return
+            self.is_playing = True
+        if self.audio_player:
+            self.audio_player.resume()
+
+    def get_playback_status(self):
+        """Get current playback status"""
+        # Snapshot both fields in one locked read so the status can't mix a
+        # new is_playing with an old sequence; formatting happens unlocked
+        with self.state_lock:
+            is_playing = self.is_playing
+            sequence = self.current_sequence
+
+        if is_playing and sequence:
+            position = self.audio_player.get_position() if self.audio_player else 0
+            duration = sequence.song.duration
+            progress = (position / duration * 100) if duration > 0 else 0
+
+            return {
+                'is_playing': True,
+                'current_sequence': {
+                    'id': sequence.id,
+                    'name': getattr(sequence, 'name', 'Temporary Sequence'),
+                    'song_name': sequence.song.name
+                },
+                'current_time': position,
+                'total_time': duration,
+                'progress': progress
+            }
+        else:
+            return {'is_playing': False}
+
+# Module-level singleton and wrappers so existing callers keep working
+engine = PlaybackEngine()
 
-        device = patched_device.device
-        channels = device.get_channels()
+def init_playback(dmx_ctrl, audio_ctrl, app_instance=None):
+    """Initialize playback with controller references"""
+    engine.init(dmx_ctrl, audio_ctrl, app_instance)
 
-        print(f"[DMX] Clearing device: {device.name}, start_address: {patched_device.start_address}, channels: {len(channels)}")
+def button_handler():
+    engine.button_handler()
 
-        for i, channel in enumerate(channels):
-            dmx_address = patched_device.start_address + i
-            channel_type = channel.get('type')
+def trigger_sequence_playback():
+    engine.trigger_sequence_playback()
 
-            # Clear channels based on event type
-            if event_type == 'dimmer' and channel_type == 'dimmer_channel':
-                print(f"[DMX] Clearing dimmer CH{dmx_address} = 0")
-                dmx_controller.set_channel(dmx_address, 0)
-            elif event_type == 'color':
-                if channel_type in ['red_channel', 'green_channel', 'blue_channel', 'white_channel']:
-                    print(f"[DMX] Clearing color channel CH{dmx_address} = 0")
-                    dmx_controller.set_channel(dmx_address, 0)
-            elif event_type == 'position':
-                if channel_type in ['pan', 'tilt']:
-                    print(f"[DMX] Clearing position channel CH{dmx_address} = 0")
-                    dmx_controller.set_channel(dmx_address, 0)
+def play_sequence(sequence, start_time=0):
+    engine.play_sequence(sequence, start_time)
 
 def apply_default_values():
-    """Apply default DMX values to all patched devices when no sequence is playing"""
-    global flask_app, dmx_controller, is_playing
-
-    if not flask_app or not dmx_controller:
-        return
-
-    # CRITICAL: Only apply defaults when NO sequence is playing
-    if is_playing:
-        print("[DMX] Skipping default values - sequence is playing")
-        return
-
-    print("[DMX] Applying default values to patched devices")
-
-    with flask_app.app_context():
-        patched_devices = PatchedDevice.query.all()
-        for patch in patched_devices:
-            device = patch.device
-            channels = device.get_channels()
-            default_values = device.get_default_values()
-
-            # Apply default values for each channel
-            for i, channel in enumerate(channels):
-                dmx_address = patch.start_address + i
-                # Use default value if available, otherwise use 0
-                default_value = default_values[i] if i < len(default_values) else 0
-                dmx_controller.set_channel(dmx_address, default_value)
-                print(f"[DMX] Setting default CH{dmx_address} = {default_value}")
+    engine.apply_default_values()
 
 def stop_playback():
-    """Stop current playback and restore default values"""
-    global is_playing, current_sequence
-
-    print("[INFO] Stopping playback")
-    is_playing = False
-    current_sequence = None
-
-    if audio_player:
-        audio_player.stop()
-        time.sleep(0.1)
-
-    # Clear all DMX channels first
-    if dmx_controller:
-        dmx_controller.clear_all()
-        time.sleep(0.05)  # Brief delay to ensure clear is applied
-        # Apply default values
-        apply_default_values()
+    engine.stop_playback()
 
 def pause_playback():
-    """Pause current playback"""
-    global is_playing
-    
-    if is_playing:
-        is_playing = False
-        if audio_player:
-            audio_player.pause()
+    engine.pause_playback()
 
 def resume_playback():
-    """Resume paused playback"""
-    global is_playing
-    
-    if not is_playing and current_sequence:
-        is_playing = True
-        if audio_player:
-            audio_player.resume()
+    engine.resume_playback()
 
 def get_playback_status():
-    """Get current playback status"""
-    if is_playing and current_sequence:
-        position = audio_player.get_position() if audio_player else 0
-        duration = current_sequence.song.duration
-        progress = (position / duration * 100) if duration > 0 else 0
-        
-        return {
-            'is_playing': True,
-            'current_sequence': {
-                'id': current_sequence.id,
-                'name': getattr(current_sequence, 'name', 'Temporary Sequence'),
-                'song_name': current_sequence.song.name
-            },
-            'current_time': position,
-            'total_time': duration,
-            'progress': progress
-        }
-    else:
-        return {'is_playing': False}
\ No newline at end of file
+    return engine.get_playback_status()
+
+def __getattr__(name):
+    # Keep module attributes like playback.is_playing tracking the singleton
+    if name in ('current_sequence', 'is_playing', 'dmx_controller', 'audio_player', 'flask_app'):
+        return getattr(engine, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
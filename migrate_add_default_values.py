@@ -21,22 +21,26 @@ def migrate():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
-    try:
-        # Check if column already exists
-        cursor.execute("PRAGMA table_info(device)")
-        columns = [row[1] for row in cursor.fetchall()]
-
-        if 'default_values' in columns:
-            print("Migration already applied: default_values column exists")
-            return
+    # Same WAL/synchronous tuning the app applies at connection setup
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
 
+    try:
         print("Adding default_values column to device table...")
 
-        # Add the new column
-        cursor.execute("""
-            ALTER TABLE device
-            ADD COLUMN default_values TEXT
-        """)
+        # Just attempt the ALTER: SQLite rejects a duplicate column with a
+        # clear error, which doubles as the "already applied" check without
+        # a table_info scan
+        try:
+            cursor.execute("""
+                ALTER TABLE device
+                ADD COLUMN default_values TEXT
+            """)
+        except sqlite3.OperationalError as e:
+            if 'duplicate column' in str(e).lower():
+                print("Migration already applied: default_values column exists")
+                return
+            raise
 
         conn.commit()
         print("Migration completed successfully!")
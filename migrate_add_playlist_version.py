@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Migration script to add version column to Playlist table.
+The version counter is bumped whenever a playlist's sequences change, so
+random-mode playback can detect playlist edits with an integer compare.
+"""
+
+import sqlite3
+import sys
+import os
+
+# Database path
+DB_PATH = 'instance/dmx_control.db'
+
+def migrate():
+    """Add version column to Playlist table if it doesn't exist"""
+
+    if not os.path.exists(DB_PATH):
+        print(f"Error: Database not found at {DB_PATH}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    # Same WAL/synchronous tuning the app applies at connection setup
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+
+    try:
+        print("Adding version column to playlist table...")
+
+        # Just attempt the ALTER: SQLite rejects a duplicate column with a
+        # clear error, which doubles as the "already applied" check without
+        # a table_info scan
+        try:
+            cursor.execute("""
+                ALTER TABLE playlist
+                ADD COLUMN version INTEGER DEFAULT 0
+            """)
+        except sqlite3.OperationalError as e:
+            if 'duplicate column' in str(e).lower():
+                print("Migration already applied: version column exists")
+                return
+            raise
+
+        conn.commit()
+        print("Migration completed successfully!")
+        print("  - Added 'version' column to 'playlist' table")
+
+    except sqlite3.Error as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Database Migration: Add version to Playlist table")
+    print("=" * 60)
+    migrate()
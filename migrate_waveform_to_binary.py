@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Migration script to convert Song.waveform_data from JSON text to
+compressed binary (np.savez_compressed of the four float32 bands).
+Binary rows are ~10-20x smaller and load without a JSON parse.
+"""
+
+import io
+import json
+import sqlite3
+import sys
+import os
+
+import numpy as np
+
+# Database path
+DB_PATH = 'instance/dmx_control.db'
+
+BANDS = ('amplitude', 'low', 'mid', 'high')
+
+def migrate():
+    """Re-encode any JSON-text waveform rows as compressed binary"""
+
+    if not os.path.exists(DB_PATH):
+        print(f"Error: Database not found at {DB_PATH}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    # Same WAL/synchronous tuning the app applies at connection setup; this
+    # migration rewrites every waveform blob, so commit cost matters here
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+
+    try:
+        cursor.execute("SELECT id, waveform_data FROM song WHERE waveform_data IS NOT NULL")
+        rows = cursor.fetchall()
+
+        converted = 0
+        for song_id, waveform_data in rows:
+            if isinstance(waveform_data, bytes):
+                continue  # Already binary
+
+            try:
+                data = json.loads(waveform_data)
+            except (ValueError, TypeError):
+                print(f"  Skipping song {song_id}: unreadable waveform data")
+                continue
+
+            buf = io.BytesIO()
+            np.savez_compressed(buf, **{band: np.asarray(data.get(band, []), dtype=np.float32)
+                                        for band in BANDS})
+            cursor.execute("UPDATE song SET waveform_data = ? WHERE id = ?",
+                           (buf.getvalue(), song_id))
+            converted += 1
+
+        conn.commit()
+        print("Migration completed successfully!")
+        print(f"  - Converted {converted} of {len(rows)} waveform rows to binary")
+
+    except sqlite3.Error as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Database Migration: Song waveforms JSON text -> binary")
+    print("=" * 60)
+    migrate()
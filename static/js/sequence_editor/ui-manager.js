@@ -73,9 +73,9 @@ class UIManager {
                     }
                     
                     // Render waveform and sequence
-                    if (this.currentSong.waveform_data) {
-                        this.renderWaveform(this.currentSong.waveform_data, this.currentSong.duration);
-                    }
+                    this.fetchWaveform(this.currentSong.id)
+                        .then(waveform => this.renderWaveform(waveform, this.currentSong.duration))
+                        .catch(error => console.error('Error loading waveform:', error));
                     
                     if (window.sequenceEditor) {
                         window.sequenceEditor.loadSequence(this.currentSequence.events, this.currentSong.duration);
@@ -154,8 +154,9 @@ class UIManager {
                 window.playbackController.setCurrentSong(data);
             }
             
-            console.log('Calling renderWaveform with:', data.waveform_data);
-            this.renderWaveform(data.waveform_data, data.duration);
+            this.fetchWaveform(data.id)
+                .then(waveform => this.renderWaveform(waveform, data.duration))
+                .catch(error => console.error('Error loading waveform:', error));
             this.updateTimeline();
             alert('File uploaded and processed successfully!');
         })
@@ -197,6 +198,26 @@ class UIManager {
         }
     }
     
+    async fetchWaveform(songId) {
+        // Binary waveform transfer: 16-byte header of uint32 lengths
+        // (amplitude, low, mid, high) followed by the four float32 arrays.
+        // Float32Array views over the response buffer avoid the JSON parse
+        // and cost 4 bytes per sample instead of ~15 as text.
+        const response = await fetch(`/api/waveform/${songId}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const buffer = await response.arrayBuffer();
+        const lengths = new Uint32Array(buffer, 0, 4);
+        const bands = {};
+        let offset = 16;
+        ['amplitude', 'low', 'mid', 'high'].forEach((name, i) => {
+            bands[name] = new Float32Array(buffer, offset, lengths[i]);
+            offset += lengths[i] * 4;
+        });
+        return bands;
+    }
+
     renderWaveform(waveformData, duration) {
         if (window.renderWaveform) {
             window.renderWaveform(waveformData, duration);